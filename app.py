@@ -91,7 +91,7 @@ st.markdown(
     - Github Page: [daviddwlee84/DuckDB_Chat](https://github.com/daviddwlee84/DuckDB_Chat)
     - Personal Website: [David Lee](https://dwlee-personal-website.netlify.app/)
 
-    NOTE: Currently, LangChain's SQLDatabase cannot integrate with DuckDB well.
-    Currently, we will stick with the workaround => Pandas DataFrame => SQLite => SQLDatabase
+    NOTE: LangChain's / LlamaIndex's SQLDatabase of DBQA pages use [duckdb-engine](https://github.com/Mause/duckdb_engine) over the uploaded data in DuckDB
+    (tables are views of the upload, no copy into SQLite)
 """
 )
@@ -0,0 +1,386 @@
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+from collections import OrderedDict
+from types import MappingProxyType
+import functools
+import json
+import logging
+import os
+import re
+import string
+import tempfile
+import threading
+import duckdb
+from fast_autocomplete import AutoComplete
+from catalog_mirror import CatalogMirror
+from shared_database import SharedDatabase, get_shared_database
+
+# Number of recent suggestion lists kept (process-wide)
+DEFAULT_AUTOCOMPLETE_CACHE_SIZE = int(
+    os.getenv("DUCKDB_CHAT_AUTOCOMPLETE_CACHE_SIZE", 4096)
+)
+LAST_WORD_RE = re.compile(r"\w*$")
+# Persisted function indexes (one file per DuckDB version and loaded extensions)
+FUNCTION_INDEX_DIR = os.getenv(
+    "DUCKDB_CHAT_FUNCTION_INDEX_DIR",
+    os.path.join(tempfile.gettempdir(), "duckdb_chat_function_index"),
+)
+# Bump this when the index format changed
+FUNCTION_INDEX_FORMAT_VERSION = 1
+
+logger = logging.getLogger(__name__)
+
+
+class AutocompleteService:
+    """
+    SQL suggestions of the DuckDB autocomplete extension (`sql_auto_complete()`), the extension is loaded once for the process.
+
+    Recent suggestion lists are kept in an LRU cache (keyed by context and query),
+    typing more characters of the same word is answered by filtering the suggestions of the shorter prefix
+    instead of asking DuckDB again, only if that list is complete (DuckDB caps the number of suggestions,
+    a list shorter than the longest one it has returned can't be truncated).
+
+    https://duckdb.org/docs/extensions/autocomplete.html
+    """
+
+    def __init__(
+        self,
+        database: SharedDatabase,
+        cache_size: int = DEFAULT_AUTOCOMPLETE_CACHE_SIZE,
+    ) -> None:
+        self.available = (
+            "autocomplete" in database.loaded_extensions
+            or database.load_extension("autocomplete")
+        )
+        self.cache_size = cache_size
+        # (context, query) => (start offset of the completed word, suggestions)
+        self._cache: "OrderedDict[Tuple[Hashable, str], Tuple[int, List[str]]]" = (
+            OrderedDict()
+        )
+        # Longest suggestion list DuckDB has returned (a lower bound of its cap)
+        self._max_suggestions = 0
+        # NOTE: cursor of the service (for queries without session connection), used by one thread at a time
+        self._cursor = database.connection.cursor()
+        self._lock = threading.Lock()
+
+    def complete(
+        self,
+        query: str,
+        connection: Optional[duckdb.DuckDBPyConnection] = None,
+        context: Hashable = None,
+    ) -> List[str]:
+        """
+        connection: session connection, so its tables are suggested as well
+        context: identify what the suggestions depend on besides the query (e.g. session schema and table versions)
+        """
+        if not self.available:
+            return []
+        word_start = LAST_WORD_RE.search(query).start()
+        with self._lock:
+            if (cached := self._lookup(context, query, word_start)) is not None:
+                return cached
+
+        if connection is None:
+            with self._lock:
+                rows = self._suggest(self._cursor, query)
+        else:
+            rows = self._suggest(connection, query)
+        suggestions = [suggestion for suggestion, _ in rows]
+        start = rows[0][1] if rows else word_start
+
+        with self._lock:
+            self._max_suggestions = max(self._max_suggestions, len(suggestions))
+            self._put((context, query), start, suggestions)
+        return suggestions
+
+    @staticmethod
+    def _suggest(
+        connection: duckdb.DuckDBPyConnection, query: str
+    ) -> List[Tuple[str, int]]:
+        return connection.execute(
+            "SELECT suggestion, suggestion_start FROM sql_auto_complete(?);", [query]
+        ).fetchall()
+
+    def _lookup(
+        self, context: Hashable, query: str, word_start: int
+    ) -> Optional[List[str]]:
+        if (cached := self._cache.get((context, query))) is not None:
+            self._cache.move_to_end((context, query))
+            return cached[1]
+        # Shorter query of the same word (i.e. only word characters are typed since then)
+        word = query[word_start:].lower()
+        for end in range(len(query) - 1, word_start - 1, -1):
+            cached = self._cache.get((context, query[:end]))
+            if cached is None or cached[0] != word_start:
+                continue
+            if len(cached[1]) >= self._max_suggestions:
+                # The shorter list may be truncated (as long as DuckDB's cap), ask DuckDB
+                return None
+            suggestions = [
+                suggestion
+                for suggestion in cached[1]
+                if suggestion.lower().startswith(word)
+            ]
+            if not suggestions:
+                # Nothing starts with the word (e.g. typo), DuckDB still has fuzzy matches
+                return None
+            self._put((context, query), word_start, suggestions)
+            return suggestions
+        return None
+
+    def _put(
+        self, key: Tuple[Hashable, str], start: int, suggestions: List[str]
+    ) -> None:
+        self._cache[key] = (start, suggestions)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+
+@functools.lru_cache(maxsize=1)
+def get_autocomplete_service() -> AutocompleteService:
+    return AutocompleteService(get_shared_database())
+
+
+class FunctionIndex:
+    """
+    Immutable fuzzy search index of DuckDB function names (with description) and keywords.
+    Built from `duckdb_functions()` and `duckdb_keywords()` once per DuckDB version (and loaded extensions),
+    persisted to disk and shared by every session, so searching it is in-memory only (no SQL).
+
+    https://github.com/seperman/fast-autocomplete
+    """
+
+    def __init__(
+        self, descriptions: Dict[str, Optional[str]], keywords: Iterable[str]
+    ) -> None:
+        # function name => description (None if it has no description)
+        self.descriptions = MappingProxyType(dict(descriptions))
+        self.keywords = frozenset(keywords)
+        self._autocomplete = AutoComplete(
+            words={word: {} for word in (*self.descriptions, *self.keywords)},
+            # Function names contain underscore (e.g. array_agg)
+            valid_chars_for_string=string.ascii_lowercase + "_",
+        )
+
+    @classmethod
+    def build(cls, connection: duckdb.DuckDBPyConnection) -> "FunctionIndex":
+        descriptions = dict(
+            connection.execute(
+                "SELECT function_name, FIRST(description) FILTER (WHERE description IS NOT NULL) "
+                "FROM duckdb_functions() GROUP BY function_name;"
+            ).fetchall()
+        )
+        keywords = [
+            keyword
+            for keyword, in connection.execute(
+                "SELECT keyword_name FROM duckdb_keywords();"
+            ).fetchall()
+        ]
+        return cls(descriptions, keywords)
+
+    @classmethod
+    def load(cls, path: str) -> "FunctionIndex":
+        with open(path, "r", encoding="utf-8") as fp:
+            data = json.load(fp)
+        return cls(data["descriptions"], data["keywords"])
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file then rename, so other processes never read a partial index
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as fp:
+            json.dump(
+                {
+                    "descriptions": dict(self.descriptions),
+                    "keywords": sorted(self.keywords),
+                },
+                fp,
+            )
+        os.replace(temp_path, path)
+
+    def search(self, query: str, size: int = 10, max_cost: int = 2) -> List[str]:
+        return [
+            result[0]
+            for result in self._autocomplete.search(query, max_cost=max_cost, size=size)
+        ]
+
+    def description(self, name: str) -> Optional[str]:
+        return self.descriptions.get(name.strip().lower()) if name else None
+
+
+@functools.lru_cache(maxsize=1)
+def get_function_index() -> FunctionIndex:
+    """
+    Load the persisted index of current DuckDB version and loaded extensions, build and persist it if not found
+    """
+    database = get_shared_database()
+    path = os.path.join(
+        FUNCTION_INDEX_DIR,
+        "_".join(
+            [
+                f"v{FUNCTION_INDEX_FORMAT_VERSION}",
+                duckdb.__version__,
+                *sorted(database.loaded_extensions),
+            ]
+        )
+        + ".json",
+    )
+    if os.path.exists(path):
+        try:
+            return FunctionIndex.load(path)
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning("Rebuilding function index %s: %s", path, e)
+    index = FunctionIndex.build(database.connection.cursor())
+    try:
+        index.save(path)
+    except OSError as e:
+        logger.warning("Function index is not persisted to %s: %s", path, e)
+    return index
+
+
+class PrefixTrie:
+    """
+    Case-insensitive prefix trie of words (the original case is kept),
+    every word has a reference count (e.g. same column name in multiple tables), so it can be added and removed incrementally.
+    """
+
+    # Key of the words ending at the node (children are keyed by single character)
+    _WORDS = ""
+
+    def __init__(self, words: Iterable[str] = ()) -> None:
+        self._root: dict = {}
+        for word in words:
+            self.add(word)
+
+    def _node(self, prefix: str, create: bool = False) -> Optional[dict]:
+        node = self._root
+        for char in prefix.lower():
+            if char not in node:
+                if not create:
+                    return None
+                node[char] = {}
+            node = node[char]
+        return node
+
+    def add(self, word: str) -> None:
+        words: Dict[str, int] = self._node(word, create=True).setdefault(
+            self._WORDS, {}
+        )
+        words[word] = words.get(word, 0) + 1
+
+    def remove(self, word: str) -> None:
+        node = self._node(word)
+        words: Optional[Dict[str, int]] = node.get(self._WORDS) if node else None
+        if not words or word not in words:
+            return
+        words[word] -= 1
+        if words[word] <= 0:
+            del words[word]
+
+    def complete(self, prefix: str, limit: int = 10) -> List[str]:
+        """
+        Words starting with the prefix, shorter ones first (breadth-first, stop once limit is reached)
+        """
+        node = self._node(prefix)
+        if node is None:
+            return []
+        results: List[str] = []
+        queue = [node]
+        while queue and len(results) < limit:
+            next_queue = []
+            for node in queue:
+                for key, value in node.items():
+                    if key == self._WORDS:
+                        results.extend(value)
+                    else:
+                        next_queue.append(value)
+            queue = next_queue
+        return results[:limit]
+
+
+@functools.lru_cache(maxsize=1)
+def get_name_tries() -> Tuple[PrefixTrie, PrefixTrie]:
+    """
+    (functions, keywords) tries built from the function index once, shared by every session (never modified)
+    """
+    index = get_function_index()
+    return PrefixTrie(index.descriptions), PrefixTrie(
+        keyword.upper() for keyword in index.keywords
+    )
+
+
+class SchemaCompleter:
+    """
+    Completion of table, column, function and keyword names for the SQL of a session.
+
+    Tables and columns are kept in tries of the session, updated incrementally from the catalog mirror:
+    only tables whose versions changed since the last refresh (e.g. created by the query rewriter alias) are read again.
+    """
+
+    def __init__(self, catalog: CatalogMirror, limit: int = 10) -> None:
+        self.catalog = catalog
+        self.limit = limit
+        self.tables = PrefixTrie()
+        self.columns = PrefixTrie()
+        # table name => columns added to the trie
+        self._table_columns: Dict[str, List[str]] = {}
+        # table name => version seen by last refresh
+        self._versions: Dict[str, int] = {}
+
+    def refresh(self) -> None:
+        changed = [
+            name
+            for name, version in self.catalog.versions.items()
+            if self._versions.get(name) != version
+        ]
+        dropped = [name for name in self._versions if name not in self.catalog.versions]
+        if not changed and not dropped:
+            return
+        for name in [*dropped, *changed]:
+            if name in self._table_columns:
+                self.tables.remove(name)
+                for column in self._table_columns.pop(name):
+                    self.columns.remove(column)
+
+        table_columns: Dict[str, List[str]] = {name: [] for name in changed}
+        if changed:
+            for table_name, column_name in self.catalog.connection.execute(
+                "SELECT table_name, column_name FROM duckdb_columns() "
+                "WHERE (database_name = 'temp' OR (database_name = current_database() AND schema_name = current_schema())) "
+                "AND list_contains(?, table_name);",
+                [changed],
+            ).fetchall():
+                table_columns[table_name].append(column_name)
+        for name, columns in table_columns.items():
+            self.tables.add(name)
+            for column in columns:
+                self.columns.add(column)
+            self._table_columns[name] = columns
+        self._versions = dict(self.catalog.versions)
+
+    def complete(self, text: str) -> List[Tuple[str, str]]:
+        """
+        Complete the last word of the text, return (label, completed text)
+        """
+        word_start = LAST_WORD_RE.search(text).start()
+        word = text[word_start:]
+        if not word:
+            return []
+        self.refresh()
+        functions, keywords = get_name_tries()
+        suggestions: List[Tuple[str, str]] = []
+        for kind, trie in (
+            ("table", self.tables),
+            ("column", self.columns),
+            ("function", functions),
+            ("keyword", keywords),
+        ):
+            for name in trie.complete(word, self.limit - len(suggestions)):
+                suggestions.append((f"{name} ({kind})", text[:word_start] + name))
+            if len(suggestions) >= self.limit:
+                break
+        return suggestions
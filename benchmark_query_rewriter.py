@@ -0,0 +1,103 @@
+"""
+Micro-benchmark of QueryRewriterForDuckDB.rewrite() throughput
+
+python benchmark_query_rewriter.py [--number 20000]
+
+- before: the previous regex / str.replace implementation (copied below for comparison)
+- tokenizer: the DuckDB tokenizer based implementation without memo
+- memoized: the current implementation (repeated queries hit the LRU memo)
+
+Table aliases named like keywords (e.g. `data = SELECT *`) are checked against the previous implementation first.
+"""
+
+from typing import Callable, List, Set
+import argparse
+import re
+import timeit
+from utils import QueryRewriterForDuckDB, rewrite_query
+
+QUERIES = [
+    "SELECT *",
+    "SELECT count(*) FROM tbl",
+    "select symbol, avg(price) AS avg_price GROUP BY symbol ORDER BY avg_price DESC",
+    "tbl2 = SELECT * WHERE price > 100",
+    "tbl",
+    "md5('123')",
+    "SELECT a.symbol, b.price FROM tbl a JOIN tbl2 b USING (symbol) WHERE a.note = 'FROM SELECT'",
+    "DESCRIBE tbl",
+]
+# DuckDB tokenizes these common names as keywords
+KEYWORD_TABLE_NAMES = [
+    "data",
+    "name",
+    "value",
+    "year",
+    "type",
+    "source",
+    "version",
+    "location",
+]
+QUERIES += [f"{name} = SELECT *" for name in KEYWORD_TABLE_NAMES]
+
+create_table_alias_re: re.Pattern = re.compile(r"(?i)^(\w+)\s*=\s*(.*)")
+
+
+def before_rewrite(
+    query: str, latest_table: str, current_active_tables: Set[str]
+) -> str:
+    if create_table_alias := create_table_alias_re.search(query):
+        query = f"CREATE OR REPLACE TABLE {create_table_alias.group(1)} AS {create_table_alias.group(2)}"
+    if "FROM" not in query.upper():
+        if "SELECT" in query:
+            query = query.replace("SELECT", f"FROM {latest_table} SELECT")
+        elif "select" in query:
+            query = query.replace("select", f"FROM {latest_table} SELECT")
+    if "SELECT" not in query.upper():
+        if query.strip() in current_active_tables:
+            query = f"FROM {query.strip()} SELECT *;"
+        else:
+            query = f"SELECT {query};"
+    if not query.endswith(";"):
+        query += ";"
+    return query
+
+
+def measure(name: str, rewrite: Callable[[str], str], number: int) -> None:
+    queries: List[str] = [QUERIES[i % len(QUERIES)] for i in range(number)]
+    seconds = timeit.timeit(lambda: [rewrite(query) for query in queries], number=1)
+    print(f"{name:>10}: {number / seconds:12,.0f} queries/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=20000)
+    args = parser.parse_args()
+
+    current_active_tables = {"tbl", "tbl2"}
+    for name in KEYWORD_TABLE_NAMES:
+        query = f"{name} = SELECT *"
+        assert rewrite_query(query, "tbl", False).startswith(
+            f"CREATE OR REPLACE TABLE {name} AS "
+        ), (query, rewrite_query(query, "tbl", False))
+        assert before_rewrite(query, "tbl", current_active_tables).startswith(
+            f"CREATE OR REPLACE TABLE {name} AS "
+        )
+    rewrite_query.cache_clear()
+    rewriter = QueryRewriterForDuckDB(latest_table="tbl")
+    rewriter.current_active_tables = current_active_tables
+
+    measure(
+        "before",
+        lambda query: before_rewrite(query, "tbl", current_active_tables),
+        args.number,
+    )
+    measure(
+        "tokenizer",
+        lambda query: rewrite_query.__wrapped__(
+            query, "tbl", query.strip() in current_active_tables
+        ),
+        args.number,
+    )
+    rewrite_query.cache_clear()
+    measure("memoized", rewriter.rewrite, args.number)
+    print(rewrite_query.cache_info())
@@ -0,0 +1,39 @@
+"""
+Populate a local DuckDB extension directory for air-gapped hosts
+
+python bundle_extensions.py --directory ./duckdb_extensions [--extensions httpfs,autocomplete] [--repository URL_OR_PATH]
+
+Run it on a host with network access (same DuckDB version and platform), copy the directory to the air-gapped hosts,
+and set `DUCKDB_CHAT_EXTENSION_DIR` to it. Extensions are then loaded once per process without any download.
+"""
+
+import argparse
+import duckdb
+from shared_database import DEFAULT_EXTENSIONS
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--directory", required=True)
+    parser.add_argument("--extensions", default=DEFAULT_EXTENSIONS)
+    parser.add_argument(
+        "--repository",
+        default="",
+        help="Extension repository (default is the DuckDB core repository)",
+    )
+    args = parser.parse_args()
+
+    connection = duckdb.connect(config={"extension_directory": args.directory})
+    for extension in args.extensions.split(","):
+        if not (extension := extension.strip()):
+            continue
+        connection.execute(
+            f"INSTALL {extension} FROM '{args.repository}';"
+            if args.repository
+            else f"INSTALL {extension};"
+        )
+        print(f"Installed {extension}")
+    print(
+        connection.execute(
+            "SELECT extension_name, install_path FROM duckdb_extensions() WHERE installed;"
+        ).df()
+    )
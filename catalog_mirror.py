@@ -0,0 +1,183 @@
+from typing import Dict, Iterator, List, NamedTuple, Optional, Set
+import itertools
+import duckdb
+from query_cache import READ_ONLY_STATEMENT_TYPES, _identifiers
+from shared_database import _quote_identifier
+
+# Statements that change the catalog (create / replace / drop objects) but not content of existing objects
+DDL_STATEMENT_TYPES = {
+    duckdb.StatementType.CREATE,
+    duckdb.StatementType.DROP,
+    duckdb.StatementType.ALTER,
+    duckdb.StatementType.CREATE_FUNC,
+    duckdb.StatementType.ATTACH,
+    duckdb.StatementType.DETACH,
+}
+# Statements that only read (don't change catalog nor settings)
+QUERY_STATEMENT_TYPES = {duckdb.StatementType.SELECT, duckdb.StatementType.EXPLAIN}
+# https://duckdb.org/docs/sql/meta/duckdb_table_functions
+# Objects of the current schema (i.e. schema of the session) and temporary ones (e.g. registered DataFrame)
+CATALOG_QUERY = """
+SELECT table_name, 'table', table_oid, column_count, estimated_size, NULL
+FROM duckdb_tables()
+WHERE NOT internal AND (temporary OR (database_name = current_database() AND schema_name = current_schema()))
+UNION ALL
+SELECT view_name, 'view', view_oid, column_count, NULL, sql
+FROM duckdb_views()
+WHERE NOT internal AND (temporary OR (database_name = current_database() AND schema_name = current_schema()))
+"""
+
+
+class CatalogEntry(NamedTuple):
+    """
+    oid changes whenever the object is created again (e.g. `CREATE OR REPLACE`, register a new DataFrame)
+    sql is the definition of a view (empty for registered objects)
+    """
+
+    kind: str
+    oid: int
+    column_count: int
+    estimated_size: int
+    sql: Optional[str]
+
+
+class CatalogChange(NamedTuple):
+    """
+    created: tables / views created or replaced (in creation order)
+    changed: every name whose version is bumped (including dropped ones)
+    """
+
+    created: List[str]
+    changed: Set[str]
+
+
+class CatalogMirror:
+    """
+    Mirror of tables and views of a (session) connection, synced from `duckdb_tables()` and `duckdb_views()`
+    (instead of guessing from the SQL text).
+
+    Every name has a version which is bumped when the object is created, replaced, dropped or (maybe) modified,
+    downstream caches (e.g. query results, table metadata) are keyed by versions for invalidation.
+    A view is bumped when a name it reads is bumped (registered objects over files or Arrow read no catalog object, so only when re-registered).
+    Versions come from a single counter, so a re-created table never gets a version it had before.
+    """
+
+    def __init__(self, connection: duckdb.DuckDBPyConnection) -> None:
+        self.connection = connection
+        self.entries: Dict[str, CatalogEntry] = {}
+        # NOTE: updated in place, callers can keep a reference
+        self.versions: Dict[str, int] = {}
+        # Increased whenever catalog or settings may have changed (e.g. DDL, SET), for caches of metadata
+        self.generation = 0
+        self._clock = itertools.count(1)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.entries
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.entries)
+
+    @property
+    def names(self) -> List[str]:
+        return list(self.entries)
+
+    def bump(self, name: str) -> int:
+        self.versions[name] = next(self._clock)
+        return self.versions[name]
+
+    def dependencies(self, name: str, entry: CatalogEntry) -> Optional[Set[str]]:
+        """
+        Names a view reads: tables it reads (views expanded by DuckDB) plus names used in its SQL (i.e. views it reads).
+        None if it can't be bound (e.g. a table it reads is dropped), then it is treated as reading everything.
+        https://duckdb.org/docs/api/python/reference/#duckdb.DuckDBPyConnection.get_table_names
+        """
+        try:
+            tables = self.connection.get_table_names(
+                f"SELECT * FROM {_quote_identifier(name)}"
+            )
+        except duckdb.Error:
+            return None
+        return tables | (_identifiers(entry.sql) if entry.sql else set())
+
+    def _add_dependent_views(self, changed: Set[str]) -> None:
+        """
+        Add views reading a changed name (directly or through other views) to changed
+        """
+        dependencies = {
+            name: self.dependencies(name, entry)
+            for name, entry in self.entries.items()
+            if entry.kind == "view" and name not in changed
+        }
+        while affected := {
+            name
+            for name, names in dependencies.items()
+            if names is None or names & changed
+        }:
+            changed |= affected
+            for name in affected:
+                del dependencies[name]
+
+    def sync(self) -> CatalogChange:
+        """
+        Read the catalog once and bump the names which are new, replaced or dropped since the last sync
+        (and the views reading them)
+        """
+        entries = {
+            name: CatalogEntry(*entry)
+            for name, *entry in self.connection.execute(CATALOG_QUERY).fetchall()
+        }
+        created = sorted(
+            (
+                name
+                for name, entry in entries.items()
+                if name not in self.entries or self.entries[name].oid != entry.oid
+            ),
+            key=lambda name: entries[name].oid,
+        )
+        dropped = [name for name in self.entries if name not in entries]
+        self.entries = entries
+
+        changed = {*created, *dropped}
+        if changed:
+            # Views read other objects, the ones reading a changed name are changed as well
+            self._add_dependent_views(changed)
+            self.generation += 1
+        for name in changed:
+            self.bump(name)
+        for name in dropped:
+            del self.versions[name]
+        return CatalogChange(created, changed)
+
+    def after_statement(self, sql: str) -> CatalogChange:
+        """
+        Sync after executing the SQL (incremental, read-only statements don't touch the catalog).
+        Content of tables changed in place (e.g. INSERT, UPDATE) can't be told from the catalog,
+        every table (and views reading them) is treated as changed then.
+        """
+        try:
+            statement_types = {
+                statement.type for statement in duckdb.extract_statements(sql)
+            }
+        except duckdb.Error:
+            statement_types = None
+        if statement_types is None or not statement_types <= QUERY_STATEMENT_TYPES:
+            self.generation += 1
+        if statement_types is not None and statement_types <= READ_ONLY_STATEMENT_TYPES:
+            return CatalogChange([], set())
+
+        change = self.sync()
+        if statement_types is None or not statement_types <= (
+            DDL_STATEMENT_TYPES | READ_ONLY_STATEMENT_TYPES
+        ):
+            changed = {
+                name for name, entry in self.entries.items() if entry.kind == "table"
+            }
+            self._add_dependent_views(changed)
+            for name in changed:
+                self.bump(name)
+            change.changed.update(changed)
+        return change
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.versions.clear()
@@ -0,0 +1,44 @@
+from typing import Dict, Hashable
+import functools
+import threading
+import duckdb
+import pyarrow as pa
+from shared_database import get_shared_database
+
+
+class CatalogSnapshot:
+    """
+    Results of metadata queries (e.g. `duckdb_functions()`, `duckdb_settings()`) of a connection.
+
+    Each query only runs when its result is first asked for (lazy), and is kept as Arrow table until the generation changes
+    (i.e. catalog or settings changed by DDL or `SET`, see `CatalogMirror.generation`).
+    """
+
+    def __init__(self, connection: duckdb.DuckDBPyConnection) -> None:
+        self.connection = connection
+        self.generation: Hashable = None
+        self._results: Dict[str, pa.Table] = {}
+        self._lock = threading.Lock()
+
+    def get(self, query: str, generation: Hashable = None) -> pa.Table:
+        with self._lock:
+            if generation != self.generation:
+                self._results.clear()
+                self.generation = generation
+            if query not in self._results:
+                self._results[query] = self.connection.execute(
+                    query
+                ).fetch_arrow_table()
+            return self._results[query]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._results.clear()
+
+
+@functools.lru_cache(maxsize=1)
+def get_shared_catalog_snapshot() -> CatalogSnapshot:
+    """
+    Snapshot of the shared DuckDB instance (for sessions without their own connection)
+    """
+    return CatalogSnapshot(get_shared_database().connection.cursor())
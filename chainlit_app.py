@@ -1,9 +1,15 @@
-from typing import Optional, Dict
+from typing import Optional, List, Tuple, Union
+from functools import partial
 import chainlit as cl
-import pandas as pd
 import duckdb
 import time
 from utils import QueryRewriterForDuckDB
+from file_loader import get_extension, load_files, sniff_csv, unique_table_name
+from ingestion_cache import get_ingestion_cache
+from query_cache import QueryResultCache
+from catalog_mirror import CatalogChange, CatalogMirror
+from query_executor import SessionQueryLimiter
+from shared_database import SessionDatabase, get_shared_database
 import os
 
 
@@ -14,67 +20,144 @@ show_time: bool = True
 DEFAULT_TABLE_NAME = "tbl"
 
 
+def invalidate_tables(query_cache: QueryResultCache, change: CatalogChange) -> None:
+    """
+    Drop cached query results of changed tables (they can't be hit anymore since their versions are bumped)
+    """
+    for table_name in change.changed:
+        query_cache.invalidate(table_name)
+
+
 async def upload_new_table(
-    file_path: str,
-    simplified_file_name: str = None,
+    file_path: Union[str, List[str]],
+    simplified_file_name: Union[str, List[str]] = None,
     table_name: str = DEFAULT_TABLE_NAME,
     extension: str = None,
 ):
     """
-    TODO: Support multiple-file input
+    Multiple files (same extension and schema) are loaded as a single table
 
     mime='text/csv'
     mime='application/octet-stream'
     """
     # https://docs.chainlit.io/concepts/user-session
-    global_table_df: Dict[str, pd.DataFrame] = cl.user_session.get("global_table_df")
-    # TODO: add more file type support
-    # TODO: add multi-file suport
+    duckdb_connect: duckdb.DuckDBPyConnection = cl.user_session.get("duckdb_connect")
+    query_rewriter: QueryRewriterForDuckDB = cl.user_session.get("query_rewriter")
+    catalog: CatalogMirror = cl.user_session.get("catalog")
+    query_cache: QueryResultCache = cl.user_session.get("query_cache")
+    file_paths = file_path if isinstance(file_path, list) else [file_path]
+    if not simplified_file_name:
+        file_names = [os.path.basename(path) for path in file_paths]
+    elif isinstance(simplified_file_name, list):
+        file_names = simplified_file_name
+    else:
+        file_names = [simplified_file_name]
     if not extension:
         # TODO: use Pathlib
-        if simplified_file_name:
-            extension = simplified_file_name.rsplit(".", 1)[-1]
-        else:
-            extension = file_path.rsplit(".", 1)[-1]
-    if extension == "csv":
-        global_table_df[table_name] = pd.read_csv(file_path)
-    elif extension == "parquet":
-        global_table_df[table_name] = pd.read_parquet(file_path)
-    else:
-        raise NotImplementedError(f"Unknown extension {extension}")
+        extension = get_extension(file_names[0])
+    filename_column = cl.user_session.get("filename_column") or None
+    native_table = cl.user_session.get("native_table", True)
+
+    # Decide CSV encoding and delimiter once from the beginning of the (first) file
+    csv_options = sniff_csv(file_paths[0]) if extension == "csv" else None
+
+    def ingest() -> Tuple[List[str], int, str]:
+        """
+        Run in worker thread (don't use cl.user_session here)
+        """
+        # NOTE: use DuckDB parallel CSV / Parquet readers (instead of pandas), multiple files are read by a single scan (union by name)
+        # parsed tables are also cached on disk by content hash, re-upload a known file won't parse it again
+        tables = get_ingestion_cache().load(
+            file_paths,
+            loader=partial(
+                load_files,
+                file_paths,
+                connection=duckdb_connect,
+                file_names=file_names,
+                filename_column=filename_column,
+                csv_options=csv_options,
+                extension=extension,
+            ),
+            connection=duckdb_connect,
+            options={
+                "extension": extension,
+                "filename_column": filename_column,
+                # File names are written into the table by filename_column (same content with other names is another entry)
+                **({"file_names": file_names} if filename_column else {}),
+                **(csv_options or {}),
+            },
+        )
 
-    if not simplified_file_name:
-        simplified_file_name = os.path.basename(file_path)
+        # https://duckdb.org/docs/api/python/data_ingestion
+        # https://duckdb.org/docs/api/python/overview.html
+        # The first table use the given table name, others (i.e. other Excel sheets) use their own name
+        new_table_names = [table_name]
+        for other_table_name in list(tables)[1:]:
+            new_table_names.append(unique_table_name(other_table_name, new_table_names))
+        for new_table_name, relation in zip(new_table_names, tables.values()):
+            if native_table:
+                # Native DuckDB table (compressed) is much faster to query than a replacement scan of registered DataFrame
+                duckdb_connect.register("_upload", relation)
+                duckdb_connect.execute(
+                    f'CREATE OR REPLACE TABLE "{new_table_name}" AS FROM _upload;'
+                )
+                duckdb_connect.unregister("_upload")
+            else:
+                duckdb_connect.register(new_table_name, relation)
+
+        row_count = duckdb_connect.execute(
+            f'SELECT COUNT(*) FROM "{table_name}";'
+        ).fetchone()[0]
+        preview = (
+            duckdb_connect.execute(f'FROM "{table_name}" LIMIT 10;')
+            .df()
+            .to_markdown(index=True)
+        )
+        invalidate_tables(query_cache, catalog.sync())
+        return new_table_names, row_count, preview
+
+    # NOTE: parsing and loading run in worker thread, so other users are not blocked
+    query_limiter: SessionQueryLimiter = cl.user_session.get("query_limiter")
+    new_table_names, row_count, preview = await query_limiter.run(ingest)
+
+    # Keep the given table name as the latest table
+    query_rewriter.latest_table = table_name
 
     # Let the user know that the system is ready
     await cl.Message(
-        content=f"`{simplified_file_name}` uploaded as table `{table_name}`, it contains {len(global_table_df[table_name])} rows!"
+        content=f"{', '.join(f'`{file_name}`' for file_name in file_names)} uploaded as table `{table_name}`, it contains {row_count} rows!"
+        + (
+            f" Other sheets are uploaded as table {', '.join(f'`{name}`' for name in new_table_names[1:])}."
+            if len(new_table_names) > 1
+            else ""
+        )
+        + (
+            f" (parse options: {', '.join(f'`{key}={value!r}`' for key, value in csv_options.items())})"
+            if csv_options
+            else ""
+        )
     ).send()
 
     # TODO: merge them into single markdown message
     await cl.Message(content="Table Preview (first 10 rows):").send()
-    await cl.Message(
-        content=global_table_df[table_name].head(10).to_markdown(index=True)
-    ).send()
-
-    duckdb_connect: duckdb.DuckDBPyConnection = cl.user_session.get("duckdb_connect")
-    # https://duckdb.org/docs/api/python/data_ingestion
-    # https://duckdb.org/docs/api/python/overview.html
-    duckdb_connect.register(table_name, global_table_df[table_name])
-    query_rewriter: QueryRewriterForDuckDB = cl.user_session.get("query_rewriter")
-    query_rewriter.add_new_table(table_name)
+    await cl.Message(content=preview).send()
 
 
 @cl.on_chat_start
 async def start():
+    # NOTE: every chat shares a DuckDB instance (buffer pool, threads, reference databases),
+    # tables of the chat are in its own schema with a pooled cursor
+    session_database = get_shared_database().acquire()
+    cl.user_session.set("session_database", session_database)
+    cl.user_session.set("duckdb_connect", session_database.cursor)
+    # Query results are cached by query and versions of the tables it reads
+    cl.user_session.set("query_cache", QueryResultCache())
+    # Tables of this session and their versions (synced from the catalog after each statement)
     cl.user_session.set(
-        "duckdb_connect",
-        duckdb.connect(":memory:", config={"allow_unsigned_extensions": "true"}),
-    )
-    cl.user_session.set(
-        "global_table_df",
-        {},
+        "catalog", CatalogMirror(cl.user_session.get("duckdb_connect"))
     )
+    # DuckDB work of this session run in (bounded) worker threads
+    cl.user_session.set("query_limiter", SessionQueryLimiter())
 
     # https://docs.chainlit.io/advanced-features/chat-settings
     # https://github.com/Chainlit/cookbook/blob/main/image-gen/app.py
@@ -104,6 +187,18 @@ async def start():
                 initial=True,
                 description="Automatically add FROM table if not given.",
             ),
+            cl.input_widget.Switch(
+                id="NativeTable",
+                label="Native Table",
+                initial=True,
+                description="Load uploaded file into native DuckDB table (otherwise register as view of the file). Take effect when uploading new file.",
+            ),
+            cl.input_widget.TextInput(
+                id="FilenameColumn",
+                label="File Name Column",
+                initial="",
+                description="Column name of the source file name when uploading multiple files (empty means don't add).",
+            ),
             cl.input_widget.NumberInput(
                 id="RowNumberLimit",
                 label="Row Number Limit",
@@ -148,6 +243,7 @@ async def update_settings(settings: dict):
                 use_view_over_table=False,
                 auto_from_table=settings.get("QueryAutoFrom"),
                 row_limit=settings.get("RowNumberLimit", 0),
+                catalog=cl.user_session.get("catalog"),
             ),
         )
     else:
@@ -155,16 +251,42 @@ async def update_settings(settings: dict):
         query_rewriter.auto_from_table = settings.get("QueryAutoFrom")
         query_rewriter.row_limit = settings.get("RowNumberLimit", 0)
 
+    cl.user_session.set("native_table", settings.get("NativeTable", True))
+    cl.user_session.set("filename_column", settings.get("FilenameColumn", ""))
+
     global do_query_rewrite, show_time
     do_query_rewrite = settings.get("QueryRewrite")
     show_time = settings.get("ShowTime")
 
 
 @cl.step(name="Query DuckDB")
-async def query_duckdb(sql_query: str) -> str:
+async def query_duckdb(sql_query: str) -> Tuple[str, bool]:
+    """
+    Return result markdown and whether it is a cache hit
+    """
     duckdb_connect: duckdb.DuckDBPyConnection = cl.user_session.get("duckdb_connect")
+    query_cache: QueryResultCache = cl.user_session.get("query_cache")
+    catalog: CatalogMirror = cl.user_session.get("catalog")
+    query_rewriter: QueryRewriterForDuckDB = cl.user_session.get("query_rewriter")
+
+    query_limiter: SessionQueryLimiter = cl.user_session.get("query_limiter")
+
+    def execute() -> Tuple[str, bool]:
+        """
+        Run in worker thread (don't use cl.user_session here)
+        """
+        cache_key = query_cache.key(sql_query, duckdb_connect, catalog.versions)
+        if (result := query_cache.get(cache_key)) is not None:
+            return result.to_pandas().to_markdown(index=True), True
+        result = duckdb_connect.execute(sql_query).fetch_arrow_table()
+        query_cache.put(cache_key, result)
+        # Sync tables (and their versions) from the catalog, the created table become the latest table
+        invalidate_tables(query_cache, query_rewriter.after_execute(sql_query))
+        return result.to_pandas().to_markdown(index=True), False
+
+    # NOTE: execution and serialization run in worker thread, so the event loop (i.e. other users) is not blocked
     # Chainlit can handle Error and print
-    return duckdb_connect.execute(sql_query).df().to_markdown(index=True)
+    return await query_limiter.run(execute)
 
 
 @cl.step(name="Query Rewrite", language="sql")
@@ -181,10 +303,12 @@ async def main(message: cl.Message) -> None:
         if len(query.strip().split()) != 1:
             # TODO: prevent from something like 123data
             raise ValueError("Table name should be single string.")
-        if len(message.elements) > 1:
-            raise ValueError("Too many file uploaded. Currently only support 1.")
-        file = message.elements[0]
-        await upload_new_table(file.path, file.name, query)
+        # Multiple files are loaded as a single table
+        await upload_new_table(
+            [file.path for file in message.elements],
+            [file.name for file in message.elements],
+            query,
+        )
         return
 
     start = time.perf_counter()
@@ -192,7 +316,7 @@ async def main(message: cl.Message) -> None:
     global do_query_rewrite
     if do_query_rewrite:
         query = await query_rewrite(query)
-    result = await query_duckdb(query)
+    result, cache_hit = await query_duckdb(query)
     time_usage = time.perf_counter() - start
 
     actions = [
@@ -205,7 +329,21 @@ async def main(message: cl.Message) -> None:
     await cl.Message(content=result, actions=actions).send()
     global show_time
     if show_time:
-        await cl.Message(content=f"Time usage: {time_usage:.2f} seconds.").send()
+        await cl.Message(
+            content=f"Time usage: {time_usage:.2f} seconds{' (cache hit)' if cache_hit else ''}."
+        ).send()
+
+
+@cl.on_chat_end
+def end():
+    """
+    Drop tables of the chat and return its cursor to the pool
+    """
+    session_database: Optional[SessionDatabase] = cl.user_session.get(
+        "session_database"
+    )
+    if session_database is not None:
+        session_database.close()
 
 
 @cl.action_callback("Plot")
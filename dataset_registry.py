@@ -0,0 +1,194 @@
+from typing import BinaryIO, Dict, List, Optional, Union
+from functools import partial
+import shutil
+import tempfile
+import weakref
+import duckdb
+import pandas as pd
+import pyarrow as pa
+import streamlit as st
+from file_loader import get_extension, load_files, remove_temp_files, sniff_csv
+from ingestion_cache import IngestionCache, get_ingestion_cache
+from shared_database import get_shared_database
+from table_profile import TableProfile, profile_table
+
+
+class Dataset:
+    """
+    A parsed upload. Relations are lazy DuckDB scans,
+    Arrow tables and DataFrames are materialized only when a consumer asks for it (once per dataset).
+    """
+
+    def __init__(
+        self,
+        key: str,
+        file_name: str,
+        tables: Dict[str, duckdb.DuckDBPyRelation],
+        spooled_files: Optional[List[str]] = None,
+        parse_options: Optional[dict] = None,
+    ) -> None:
+        self.key = key
+        self.file_name = file_name
+        self.tables = tables
+        self.parse_options = parse_options or {}
+        self.spooled_files = spooled_files if spooled_files is not None else []
+        self._arrow_tables: Dict[str, pa.Table] = {}
+        self._dataframes: Dict[str, pd.DataFrame] = {}
+        self._profiles: Dict[str, TableProfile] = {}
+
+    @property
+    def table_names(self) -> List[str]:
+        """
+        In file order (e.g. sheet order of Excel), the first one is the "main" table
+        """
+        return list(self.tables)
+
+    def relation(self, table_name: Optional[str] = None) -> duckdb.DuckDBPyRelation:
+        return self.tables[table_name or self.table_names[0]]
+
+    def arrow(self, table_name: Optional[str] = None) -> pa.Table:
+        table_name = table_name or self.table_names[0]
+        if table_name not in self._arrow_tables:
+            self._arrow_tables[table_name] = self.tables[table_name].fetch_arrow_table()
+        return self._arrow_tables[table_name]
+
+    def df(self, table_name: Optional[str] = None) -> pd.DataFrame:
+        """
+        NOTE: the DataFrame is shared by every consumer, don't modify it inplace
+        """
+        table_name = table_name or self.table_names[0]
+        if table_name not in self._dataframes:
+            self._dataframes[table_name] = self.arrow(table_name).to_pandas()
+        return self._dataframes[table_name]
+
+    def profile(self, table_name: Optional[str] = None) -> TableProfile:
+        """
+        Preview, schema, statistics and memory footprint, computed in a single scan (once per dataset)
+        """
+        table_name = table_name or self.table_names[0]
+        if table_name not in self._profiles:
+            self._profiles[table_name] = profile_table(self.tables[table_name])
+        return self._profiles[table_name]
+
+    def close(self) -> None:
+        self._arrow_tables.clear()
+        self._dataframes.clear()
+        self._profiles.clear()
+        remove_temp_files(self.spooled_files)
+
+
+class DatasetRegistry:
+    """
+    Session-level registry of parsed uploads, shared by every page.
+    A file is parsed once per session (keyed by content hash) no matter how many pages use it.
+    Each page (consumer) hold at most one dataset, dataset without any consumer is dropped.
+    Large uploads are spooled into a per-session temp directory,
+    which is removed when the registry (i.e. the session state) is garbage collected or the process exits.
+    """
+
+    def __init__(self, connection: duckdb.DuckDBPyConnection) -> None:
+        self.connection = connection
+        self.datasets: Dict[str, Dataset] = {}
+        self.consumers: Dict[str, str] = {}
+        self.spool_dir = tempfile.mkdtemp(prefix="duckdb_chat_session_")
+        # https://docs.python.org/3/library/weakref.html#weakref.finalize
+        self._finalizer = weakref.finalize(
+            self, shutil.rmtree, self.spool_dir, ignore_errors=True
+        )
+
+    def load(
+        self,
+        files: Union[BinaryIO, List[BinaryIO]],
+        consumer: str,
+        filename_column: Optional[str] = None,
+    ) -> Dataset:
+        """
+        Get dataset of the uploaded file (parse it if no page has loaded it yet)
+        Multiple files (same extension and schema) are loaded as a single table.
+        """
+        if not isinstance(files, list):
+            files = [files]
+        options = {"extension": get_extension(files[0].name)}
+        if filename_column:
+            options["filename_column"] = filename_column
+        csv_options = None
+        if options["extension"] == "csv":
+            # Sniffing only read the beginning of the (first) file, also part of the cache key
+            csv_options = sniff_csv(files[0])
+            options.update(csv_options)
+        # File names are written into the table by filename_column, so they are part of the key then (not of parse options)
+        key = IngestionCache.cache_key(
+            files,
+            (
+                {**options, "file_names": [file.name for file in files]}
+                if filename_column
+                else options
+            ),
+        )
+        if self.consumers.get(consumer) != key:
+            self.release(consumer)
+        if key not in self.datasets:
+            spooled_files = []
+            tables = get_ingestion_cache().load(
+                files,
+                loader=partial(
+                    load_files,
+                    files,
+                    connection=self.connection,
+                    spooled_files=spooled_files,
+                    filename_column=filename_column,
+                    csv_options=csv_options,
+                    spool_dir=self.spool_dir,
+                ),
+                connection=self.connection,
+                options=options,
+                key=key,
+            )
+            self.datasets[key] = Dataset(
+                key,
+                ", ".join(file.name for file in files),
+                tables,
+                spooled_files,
+                parse_options=options,
+            )
+        self.consumers[consumer] = key
+        return self.datasets[key]
+
+    def get(self, consumer: str) -> Optional[Dataset]:
+        key = self.consumers.get(consumer)
+        return self.datasets.get(key) if key else None
+
+    def release(self, consumer: str) -> None:
+        key = self.consumers.pop(consumer, None)
+        if key is not None and key not in self.consumers.values():
+            self.datasets.pop(key).close()
+
+    def close(self) -> None:
+        for dataset in self.datasets.values():
+            dataset.close()
+        self.datasets.clear()
+        self.consumers.clear()
+        self._finalizer()
+
+
+def get_session_connection() -> duckdb.DuckDBPyConnection:
+    """
+    DuckDB connection of current Streamlit session (shared by every page)
+    It is a pooled cursor of the process-wide DuckDB instance with its own schema,
+    dropped when the session ends (i.e. session state is garbage collected).
+    """
+    if "duckdb_connect" not in st.session_state:
+        st.session_state.session_database = get_shared_database().acquire()
+        # NOTE: extensions (e.g. httpfs) are already loaded once for the process, see shared_database.py
+        st.session_state.duckdb_connect = st.session_state.session_database.cursor
+        # st.session_state.duckdb_connect.execute("SET custom_extension_repository='http://welsch.lu/duckdb/prql/latest';")
+        # BUG: duckdb.IOException: IO Error: Failed to download extension "prql" at URL "http://welsch.lu/duckdb/prql/latest/v0.8.1/windows_amd64/prql.duckdb_extension.gz Candidate extensions: "parquet", "sqlite", "sqlite3", "sqlite_scanner" (ERROR Read)
+        # st.session_state.duckdb_connect.execute("FORCE INSTALL prql;")
+        # st.session_state.duckdb_connect.execute("LOAD prql;")
+    return st.session_state.duckdb_connect
+
+
+def get_dataset_registry() -> DatasetRegistry:
+    if "dataset_registry" not in st.session_state:
+        st.session_state.dataset_registry = DatasetRegistry(get_session_connection())
+    return st.session_state.dataset_registry
@@ -0,0 +1,113 @@
+from typing import Dict, List, Optional, Tuple
+import duckdb
+from duckdb_engine import ConnectionWrapper
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import StaticPool
+from dataset_registry import Dataset
+from file_loader import unique_table_name
+from shared_database import SessionDatabase, _quote_identifier, get_shared_database
+
+# Prefix of the registered (temporary) Arrow tables behind the views of in-memory relations
+REGISTERED_TABLE_PREFIX = "_dbqa_"
+
+
+class _SessionConnection(ConnectionWrapper):
+    """
+    DBAPI connection of duckdb-engine over a cursor of the shared instance,
+    the cursor is owned by the session database (SQLAlchemy must not close it).
+    """
+
+    def close(self) -> None:
+        self.closed = True
+
+
+class DBQADatabase:
+    """
+    Tables of an uploaded dataset for LangChain / LlamaIndex `SQLDatabase`,
+    through a duckdb-engine SQLAlchemy engine over the shared DuckDB instance (instead of copying DataFrame into SQLite).
+
+    It has its own session database (schema and cursor), so page temporary objects of the same name (e.g. `tbl` of SQL Query page)
+    don't shadow its tables, and `SQLDatabase(schema=...)` only reflects this dataset.
+    Tables are exposed as views of the schema over the dataset relation's own scan (`relation.sql_query()`,
+    e.g. `read_parquet()` of the cached / uploaded file), so nothing is materialized (registered objects are temporary,
+    which SQLAlchemy reflection can't see).
+
+    NOTE: a relation over an in-memory Arrow table (i.e. Excel sheet when the ingestion cache is disabled) can't be bound by
+    another cursor (its SQL is an `arrow_scan()` of pointers), its Arrow table is registered behind the view instead.
+
+    https://github.com/Mause/duckdb_engine
+    """
+
+    def __init__(self, session_database: Optional[SessionDatabase] = None) -> None:
+        self.session_database = session_database or get_shared_database().acquire()
+        cursor = self.session_database.cursor
+        self.engine: Engine = create_engine(
+            "duckdb:///:memory:",
+            creator=lambda: _SessionConnection(cursor),
+            poolclass=StaticPool,
+        )
+        # (dataset key, main table name) of the registered tables
+        self.registered: Optional[Tuple[str, str]] = None
+        # view name => table name in the dataset
+        self.tables: Dict[str, str] = {}
+        # Arrow tables registered behind the views (only for in-memory relations)
+        self.registered_tables: List[str] = []
+
+    @property
+    def schema(self) -> str:
+        return self.session_database.schema
+
+    @property
+    def connection(self) -> duckdb.DuckDBPyConnection:
+        return self.session_database.cursor
+
+    @property
+    def table_names(self) -> List[str]:
+        return list(self.tables)
+
+    def register(self, dataset: Dataset, table_name: str) -> bool:
+        """
+        Expose the main table as `table_name` and other tables (i.e. other Excel sheets) by their own name
+        (with a suffix if it is the same as `table_name`).
+        Return False if the same dataset and name are already registered (nothing to do).
+        """
+        if self.registered == (dataset.key, table_name):
+            return False
+        self.clear()
+        if not dataset.table_names:
+            raise ValueError(f"No data found in `{dataset.file_name}`.")
+        tables = {table_name: dataset.table_names[0]}
+        for extra_table_name in dataset.table_names[1:]:
+            tables[unique_table_name(extra_table_name, tables)] = extra_table_name
+        self.tables = tables
+        for i, (view_name, source_name) in enumerate(tables.items()):
+            quoted_view_name = _quote_identifier(view_name)
+            try:
+                self.connection.execute(
+                    f"CREATE OR REPLACE VIEW {quoted_view_name} AS {dataset.relation(source_name).sql_query()};"
+                )
+            except duckdb.Error:
+                registered_name = f"{REGISTERED_TABLE_PREFIX}{i}"
+                self.connection.register(registered_name, dataset.arrow(source_name))
+                self.registered_tables.append(registered_name)
+                self.connection.execute(
+                    f"CREATE OR REPLACE VIEW {quoted_view_name} AS SELECT * FROM {registered_name};"
+                )
+        self.registered = (dataset.key, table_name)
+        return True
+
+    def clear(self) -> None:
+        for view_name in self.tables:
+            self.connection.execute(
+                f"DROP VIEW IF EXISTS {_quote_identifier(view_name)};"
+            )
+        for registered_name in self.registered_tables:
+            self.connection.unregister(registered_name)
+        self.tables = {}
+        self.registered_tables = []
+        self.registered = None
+
+    def close(self) -> None:
+        self.engine.dispose()
+        self.session_database.close()
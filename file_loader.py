@@ -0,0 +1,636 @@
+from typing import (
+    BinaryIO,
+    Collection,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Union,
+)
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache, partial
+import codecs
+import csv
+import io
+import itertools
+import multiprocessing
+import os
+import re
+import shutil
+import tempfile
+import duckdb
+import pandas as pd
+import pyarrow as pa
+
+EXCEL_BATCH_SIZE = 10000
+# Number of processes parsing Excel sheets in parallel (shared by every session), default CPU count
+DEFAULT_EXCEL_WORKERS = int(os.getenv("DUCKDB_CHAT_EXCEL_WORKERS", os.cpu_count() or 1))
+CSV_SNIFF_SIZE = 256 * 1024
+# Tried in order, the first one which can decode the sample is used (latin-1 never fail)
+CSV_ENCODING_CANDIDATES = ("utf-8", "gbk", "latin-1")
+# Chunk size of decoding / transcoding the whole CSV file
+CSV_TRANSCODE_CHUNK_SIZE = 1 << 20
+CSV_DELIMITER_CANDIDATES = ",\t;|"
+# Table name of single table file format (i.e. non-Excel) in load_file()
+DEFAULT_TABLE_KEY = "data"
+# Uploads larger than this (in bytes) are spooled to disk and read by path, default 16 MB
+SPOOL_THRESHOLD = int(os.getenv("DUCKDB_CHAT_SPOOL_THRESHOLD", 16 * 1024 * 1024))
+
+# File object (e.g. Streamlit UploadedFile) or file path (e.g. Chainlit element path)
+FileLike = Union[BinaryIO, str]
+
+
+def _quote(value: str) -> str:
+    """
+    Escape string literal in SQL
+    """
+    return value.replace("'", "''")
+
+
+def _rewind(file: FileLike) -> None:
+    if not isinstance(file, str):
+        file.seek(0)
+
+
+def _file_size(file: FileLike) -> int:
+    if isinstance(file, str):
+        return os.path.getsize(file)
+    # Streamlit UploadedFile
+    if hasattr(file, "size"):
+        return file.size
+    position = file.tell()
+    size = file.seek(0, io.SEEK_END)
+    file.seek(position)
+    return size
+
+
+def spool_to_temp_file(
+    file: BinaryIO, suffix: str = "", spool_dir: Optional[str] = None
+) -> str:
+    """
+    Copy a file object (e.g. Streamlit UploadedFile) to a temporary file on disk (under spool_dir if given).
+    Copy by chunks, so no extra in-memory copy of the upload is made.
+    Caller is responsible for removing the file (see `remove_temp_files`).
+
+    https://docs.python.org/3/library/tempfile.html#tempfile.mkstemp
+    """
+    fd, path = tempfile.mkstemp(suffix=suffix, prefix="duckdb_chat_", dir=spool_dir)
+    file.seek(0)
+    with os.fdopen(fd, "wb") as destination_file:
+        shutil.copyfileobj(file, destination_file)
+    file.seek(0)
+    return path
+
+
+def spool_large_file(
+    file: FileLike,
+    extension: str,
+    spooled_files: Optional[List[str]] = None,
+    spool_dir: Optional[str] = None,
+    threshold: int = SPOOL_THRESHOLD,
+) -> FileLike:
+    """
+    Return path of a spooled copy if the upload buffer is larger than threshold, otherwise the file itself.
+
+    NOTE: DuckDB copies a file object into its internal object store (`DUCKDB_INTERNAL_OBJECTSTORE://...`) before reading,
+    so ingesting a large upload from memory holds several copies of it at the same time.
+    Reading from a path let DuckDB (and openpyxl) stream the file instead.
+    """
+    if isinstance(file, str) or _file_size(file) <= threshold:
+        return file
+    path = spool_to_temp_file(file, suffix=f".{extension}", spool_dir=spool_dir)
+    if spooled_files is not None:
+        spooled_files.append(path)
+    return path
+
+
+def _iter_chunks(file: FileLike, chunk_size: int) -> Iterator[bytes]:
+    if isinstance(file, str):
+        with open(file, "rb") as fp:
+            while chunk := fp.read(chunk_size):
+                yield chunk
+        return
+    file.seek(0)
+    while chunk := file.read(chunk_size):
+        yield chunk
+    file.seek(0)
+
+
+def ensure_utf8_csv(
+    file: FileLike,
+    encoding: str = "utf-8",
+    spooled_files: Optional[List[str]] = None,
+    spool_dir: Optional[str] = None,
+    chunk_size: int = CSV_TRANSCODE_CHUNK_SIZE,
+) -> FileLike:
+    """
+    Return the file itself if it is valid UTF-8, otherwise a UTF-8 transcoded copy (temp file under spool_dir).
+
+    NOTE: DuckDB only reads UTF-8 CSV (`Copy is only supported for UTF-8 encoded files`),
+    other encodings need the `encodings` extension which Python read_csv() can't use.
+    The sniffed encoding only covers the sample (e.g. ASCII at the beginning, GBK later),
+    so the whole file is decoded (in chunks): strict UTF-8 first, then the given encoding,
+    then the rest of CSV_ENCODING_CANDIDATES on decode error (latin-1 never fail).
+    """
+    candidates: List[str] = []
+    for candidate in ("utf-8", encoding, *CSV_ENCODING_CANDIDATES):
+        # Deduplicated by codec name (e.g. `UTF8` and `utf-8`)
+        if codecs.lookup(candidate).name not in {
+            codecs.lookup(existing).name for existing in candidates
+        }:
+            candidates.append(candidate)
+    for candidate in candidates:
+        decoder = codecs.getincrementaldecoder(candidate)()
+        if codecs.lookup(candidate).name == "utf-8":
+            try:
+                for chunk in _iter_chunks(file, chunk_size):
+                    decoder.decode(chunk)
+                decoder.decode(b"", final=True)
+            except UnicodeDecodeError:
+                _rewind(file)
+                continue
+            return file
+
+        fd, path = tempfile.mkstemp(suffix=".csv", prefix="duckdb_chat_", dir=spool_dir)
+        try:
+            with os.fdopen(fd, "wb") as destination_file:
+                for chunk in _iter_chunks(file, chunk_size):
+                    destination_file.write(decoder.decode(chunk).encode("utf-8"))
+                destination_file.write(decoder.decode(b"", final=True).encode("utf-8"))
+        except UnicodeDecodeError:
+            _rewind(file)
+            os.remove(path)
+            continue
+        if spooled_files is not None:
+            spooled_files.append(path)
+        return path
+    raise ValueError(f"CSV file can't be decoded by any of {', '.join(candidates)}.")
+
+
+def remove_temp_files(paths: List[str]) -> None:
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    paths.clear()
+
+
+def read_parquet(
+    file: FileLike,
+    connection: duckdb.DuckDBPyConnection,
+    spooled_files: Optional[List[str]] = None,
+    spool_dir: Optional[str] = None,
+) -> duckdb.DuckDBPyRelation:
+    """
+    Scan uploaded Parquet with DuckDB native reader (instead of pd.read_parquet + duckdb.from_df)
+    So projection / filter pushdown and row group skipping works.
+
+    NOTE: duckdb.read_parquet() requires filename (or fsspec which copies the whole buffer into its object store),
+    so we spool the upload buffer into a temp file. The relation is lazy, so the file must exist as long as the relation is used.
+    https://github.com/duckdb/duckdb/discussions/9857
+    """
+    if isinstance(file, str):
+        return connection.read_parquet(file)
+    path = spool_to_temp_file(file, suffix=".parquet", spool_dir=spool_dir)
+    if spooled_files is not None:
+        spooled_files.append(path)
+    return connection.read_parquet(path)
+
+
+def to_table_name(name: str) -> str:
+    """
+    Make a sheet / file name usable as (unquoted) table name
+    """
+    table_name = re.sub(r"\W+", "_", name.strip()).strip("_") or "sheet"
+    if table_name[0].isdigit():
+        table_name = f"_{table_name}"
+    return table_name
+
+
+def unique_table_name(name: str, existing: Collection[str]) -> str:
+    """
+    Add suffix (`_2`, `_3`, ...) if the name is already taken (case-insensitive, as DuckDB identifiers)
+    """
+    taken = {table_name.lower() for table_name in existing}
+    table_name = name
+    suffix = 2
+    while table_name.lower() in taken:
+        table_name = f"{name}_{suffix}"
+        suffix += 1
+    return table_name
+
+
+def _excel_header(header: Sequence) -> List[str]:
+    columns = []
+    for i, name in enumerate(header):
+        name = str(name) if name is not None else f"column{i}"
+        column = name
+        suffix = 1
+        while column in columns:
+            column = f"{name}_{suffix}"
+            suffix += 1
+        columns.append(column)
+    return columns
+
+
+def _excel_rows_to_record_batch(
+    rows: List[tuple], columns: List[str]
+) -> pa.RecordBatch:
+    width = len(columns)
+    # rows in read-only mode can be ragged
+    rows = [tuple(row[:width]) + (None,) * (width - len(row)) for row in rows]
+    arrays = []
+    for values in zip(*rows):
+        try:
+            arrays.append(pa.array(values))
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # Mixed type column (e.g. number and text) => fallback to string
+            arrays.append(
+                pa.array([None if v is None else str(v) for v in values], pa.string())
+            )
+    return pa.RecordBatch.from_arrays(arrays, names=columns)
+
+
+def _unify_type(types: Iterable[pa.DataType]) -> pa.DataType:
+    types = {t for t in types if not pa.types.is_null(t)}
+    if not types:
+        return pa.null()
+    if len(types) == 1:
+        return types.pop()
+    if all(pa.types.is_integer(t) or pa.types.is_floating(t) for t in types):
+        return pa.float64()
+    return pa.string()
+
+
+def _concat_record_batches(
+    batches: List[pa.RecordBatch], columns: List[str]
+) -> pa.Table:
+    """
+    Type of each batch is inferred separately, so cast them to a common schema first
+    """
+    if not batches:
+        return pa.table({column: pa.array([], pa.null()) for column in columns})
+    schema = pa.schema(
+        [
+            (column, _unify_type(batch.schema.field(i).type for batch in batches))
+            for i, column in enumerate(columns)
+        ]
+    )
+    return pa.Table.from_batches(
+        [batch if batch.schema == schema else batch.cast(schema) for batch in batches],
+        schema=schema,
+    )
+
+
+def _open_workbook(source: Union[bytes, str], **kwargs):
+    import openpyxl
+
+    # A path is read lazily from disk (zip members are decompressed on demand)
+    return openpyxl.load_workbook(
+        source if isinstance(source, str) else io.BytesIO(source),
+        read_only=True,
+        **kwargs,
+    )
+
+
+def _read_excel_sheet(
+    source: Union[bytes, str], sheet_name: str, batch_size: int
+) -> pa.Table:
+    """
+    Stream rows of a single sheet (openpyxl read-only mode) into Arrow record batches.
+    Each worker process opens its own workbook.
+    source is the content of the file or its path.
+
+    https://openpyxl.readthedocs.io/en/stable/optimized.html
+    """
+    workbook = _open_workbook(source, data_only=True)
+    try:
+        rows = workbook[sheet_name].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return pa.table({})
+        columns = _excel_header(header)
+        batches = [
+            _excel_rows_to_record_batch(chunk, columns)
+            for chunk in iter(lambda: list(itertools.islice(rows, batch_size)), [])
+        ]
+    finally:
+        workbook.close()
+    return _concat_record_batches(batches, columns)
+
+
+@lru_cache(maxsize=1)
+def get_excel_executor() -> ProcessPoolExecutor:
+    """
+    Process-wide worker processes for parsing Excel sheets.
+    openpyxl is pure Python (holds the GIL), so sheets are only parsed in parallel by separate processes
+    (source path / bytes in, Arrow tables out, both picklable).
+
+    NOTE: forkserver (spawn on Windows) instead of fork, forking a process with running threads (e.g. Streamlit, DuckDB) may deadlock.
+    https://docs.python.org/3/library/multiprocessing.html#contexts-and-start-methods
+    """
+    start_method = (
+        "forkserver"
+        if "forkserver" in multiprocessing.get_all_start_methods()
+        else "spawn"
+    )
+    return ProcessPoolExecutor(
+        max_workers=DEFAULT_EXCEL_WORKERS,
+        mp_context=multiprocessing.get_context(start_method),
+    )
+
+
+def read_excel(
+    file: FileLike,
+    batch_size: int = EXCEL_BATCH_SIZE,
+    extension: Optional[str] = None,
+) -> Dict[str, pa.Table]:
+    """
+    Read every sheet of an Excel file as Arrow table (sheet name => table),
+    sheets are parsed in parallel by worker processes (see `get_excel_executor()`), a single sheet is parsed in this process.
+    Legacy `.xls` is not supported by openpyxl, fallback to pd.read_excel (all sheets).
+    """
+    _rewind(file)
+    extension = extension or get_extension(
+        file if isinstance(file, str) else getattr(file, "name", "")
+    )
+    if extension == "xls":
+        return {
+            sheet_name: pa.Table.from_pandas(df, preserve_index=False)
+            for sheet_name, df in pd.read_excel(file, sheet_name=None).items()
+        }
+
+    if isinstance(file, str):
+        source = file
+    else:
+        source = file.read()
+        file.seek(0)
+    workbook = _open_workbook(source)
+    sheet_names = workbook.sheetnames
+    workbook.close()
+
+    read_sheet = partial(_read_excel_sheet, source, batch_size=batch_size)
+    tables = None
+    if len(sheet_names) > 1 and DEFAULT_EXCEL_WORKERS > 1:
+        try:
+            tables = list(get_excel_executor().map(read_sheet, sheet_names))
+        except BrokenProcessPool:
+            # e.g. a worker is killed (out of memory), parse here instead, the next upload gets a new pool
+            get_excel_executor.cache_clear()
+    if tables is None:
+        tables = [read_sheet(sheet_name) for sheet_name in sheet_names]
+    # Skip empty sheets
+    return {
+        sheet_name: table
+        for sheet_name, table in zip(sheet_names, tables)
+        if table.num_columns > 0
+    }
+
+
+def read_excel_relations(
+    file: FileLike,
+    connection: duckdb.DuckDBPyConnection,
+    extension: Optional[str] = None,
+) -> Dict[str, duckdb.DuckDBPyRelation]:
+    """
+    Read every sheet of an Excel file as DuckDB relation (table name => relation, in sheet order)
+    Sheet names which are the same after `to_table_name()` get a suffix (e.g. `Sales 2024` and `Sales-2024`).
+    Raise ValueError if no sheet has data.
+    """
+    relations: Dict[str, duckdb.DuckDBPyRelation] = {}
+    for sheet_name, arrow_table in read_excel(file, extension=extension).items():
+        relations[unique_table_name(to_table_name(sheet_name), relations)] = (
+            connection.from_arrow(arrow_table)
+        )
+    if not relations:
+        raise ValueError("No data found in any sheet of the Excel file.")
+    return relations
+
+
+def sniff_csv(file: FileLike, sample_size: int = CSV_SNIFF_SIZE) -> Dict[str, str]:
+    """
+    Pick encoding and delimiter from the first sample_size bytes
+    (instead of parse the whole file, fail, and parse again with other encoding).
+    Return read_csv() options, delimiter is omitted (DuckDB auto detect) if it can't be decided.
+    """
+    if isinstance(file, str):
+        with open(file, "rb") as fp:
+            sample = fp.read(sample_size)
+    else:
+        file.seek(0)
+        sample = file.read(sample_size)
+        file.seek(0)
+
+    for encoding in CSV_ENCODING_CANDIDATES:
+        try:
+            # Incremental decoder won't fail on multi-byte character cut at the end of sample
+            text = codecs.getincrementaldecoder(encoding)().decode(sample, final=False)
+            break
+        except UnicodeDecodeError:
+            continue
+    options = {"encoding": encoding}
+
+    # Only sniff complete lines
+    lines = text.splitlines()[:-1] if len(sample) == sample_size else text.splitlines()
+    try:
+        options["delimiter"] = (
+            csv.Sniffer()
+            .sniff("\n".join(lines[:100]), delimiters=CSV_DELIMITER_CANDIDATES)
+            .delimiter
+        )
+    except csv.Error:
+        pass
+    return options
+
+
+def get_extension(file_name: str) -> str:
+    return file_name.rsplit(".", 1)[-1].lower()
+
+
+def load_file(
+    file: FileLike,
+    connection: duckdb.DuckDBPyConnection,
+    spooled_files: Optional[List[str]] = None,
+    file_name: Optional[str] = None,
+    extension: Optional[str] = None,
+    csv_options: Optional[Dict[str, str]] = None,
+    spool_dir: Optional[str] = None,
+) -> Dict[str, duckdb.DuckDBPyRelation]:
+    """
+    Load uploaded file (file object or path) as DuckDB relations (table name => relation).
+    Single table formats (CSV, Parquet, Json) use DEFAULT_TABLE_KEY as table name,
+    Excel use sheet names (the first sheet is the "main" table).
+    File type is decided by extension (default is the extension of file_name, the name of file object or the path).
+    csv_options are passed to read_csv(), sniffed by `sniff_csv()` if not given.
+    CSV which is not UTF-8 is transcoded to UTF-8 first (see `ensure_utf8_csv()`).
+    Large file objects are spooled to disk first (under spool_dir, paths are appended to spooled_files).
+    """
+    file_name = file_name or (file if isinstance(file, str) else file.name)
+    extension = extension or get_extension(file_name)
+    if extension == "csv":
+        # NOTE: decide encoding up front, previously we parse it and fallback to gbk on error
+        # duckdb.InvalidInputException: Invalid Input Error: Error in file "DUCKDB_INTERNAL_OBJECTSTORE://4b3e93e58df2b90e" at line 1 in column "0": Invalid unicode (byte sequence mismatch) detected in CSV file. Parser options:
+        if csv_options is None:
+            csv_options = sniff_csv(file)
+        file = ensure_utf8_csv(
+            file,
+            csv_options.get("encoding", "utf-8"),
+            spooled_files=spooled_files,
+            spool_dir=spool_dir,
+        )
+    if extension in {"csv", "json", "xlsx"}:
+        file = spool_large_file(
+            file, extension, spooled_files=spooled_files, spool_dir=spool_dir
+        )
+    if extension == "csv":
+        _rewind(file)
+        return {
+            DEFAULT_TABLE_KEY: connection.read_csv(
+                file, **{**csv_options, "encoding": "utf-8"}
+            )
+        }
+    elif extension == "parquet":
+        return {
+            DEFAULT_TABLE_KEY: read_parquet(
+                file,
+                connection=connection,
+                spooled_files=spooled_files,
+                spool_dir=spool_dir,
+            )
+        }
+    elif extension == "json":
+        # TODO: haven't tested yet
+        _rewind(file)
+        return {DEFAULT_TABLE_KEY: connection.read_json(file)}
+    elif extension in {"xlsx", "xls"}:
+        return read_excel_relations(file, connection=connection, extension=extension)
+    else:
+        raise NotImplementedError(f"Unknown extension {extension}")
+
+
+# Formats that DuckDB can scan multiple files in one reader
+MULTI_FILE_EXTENSIONS = {"csv", "parquet", "json"}
+# Internal name of the reader's file name column (the data may already have a `filename` column)
+SOURCE_FILE_COLUMN = "__duckdb_chat_source_file"
+
+
+def load_files(
+    files: List[FileLike],
+    connection: duckdb.DuckDBPyConnection,
+    spooled_files: Optional[List[str]] = None,
+    file_names: Optional[List[str]] = None,
+    filename_column: Optional[str] = None,
+    csv_options: Optional[Dict[str, str]] = None,
+    extension: Optional[str] = None,
+    spool_dir: Optional[str] = None,
+) -> Dict[str, duckdb.DuckDBPyRelation]:
+    """
+    Load multiple files (same extension and schema, e.g. daily partitions) as a single table (union by name).
+    Files are scanned by one DuckDB reader over all the paths (in parallel) instead of ingesting one by one.
+    Schemas are verified up front (only sniffing / metadata).
+    If filename_column is given, add a column of the original file name of each row (to every sheet for Excel).
+    File type is decided by extension (default is the extension of file_names).
+    """
+    if file_names is None:
+        file_names = [file if isinstance(file, str) else file.name for file in files]
+    if not extension:
+        extensions = {get_extension(file_name) for file_name in file_names}
+        if len(extensions) != 1:
+            raise ValueError(
+                f"Multiple files should have the same extension, got {', '.join(sorted(extensions))}."
+            )
+        extension = extensions.pop()
+
+    if len(files) == 1 and (
+        not filename_column or extension not in MULTI_FILE_EXTENSIONS
+    ):
+        tables = load_file(
+            files[0],
+            connection=connection,
+            spooled_files=spooled_files,
+            file_name=file_names[0],
+            extension=extension,
+            csv_options=csv_options,
+            spool_dir=spool_dir,
+        )
+        if filename_column:
+            # e.g. Excel (every sheet is a table), there is only one file name
+            tables = {
+                table_name: relation.project(
+                    f"*, '{_quote(file_names[0])}' AS \"{filename_column}\""
+                )
+                for table_name, relation in tables.items()
+            }
+        return tables
+
+    if extension not in MULTI_FILE_EXTENSIONS:
+        raise NotImplementedError(f"Unknown extension {extension} for multiple files")
+
+    # DuckDB reader needs file paths
+    paths = []
+    for file in files:
+        if isinstance(file, str):
+            paths.append(file)
+        else:
+            paths.append(
+                spool_to_temp_file(file, suffix=f".{extension}", spool_dir=spool_dir)
+            )
+            if spooled_files is not None:
+                spooled_files.append(paths[-1])
+
+    if extension == "csv":
+        if csv_options is None:
+            csv_options = sniff_csv(paths[0])
+        # Files may have different encodings (e.g. GBK and UTF-8 exports), each one is sniffed on its own
+        encodings = [csv_options.get("encoding", "utf-8")] + [
+            sniff_csv(path)["encoding"] for path in paths[1:]
+        ]
+        paths = [
+            ensure_utf8_csv(
+                path,
+                encoding,
+                spooled_files=spooled_files,
+                spool_dir=spool_dir,
+            )
+            for path, encoding in zip(paths, encodings)
+        ]
+        reader = partial(connection.read_csv, **{**csv_options, "encoding": "utf-8"})
+    elif extension == "parquet":
+        reader = connection.read_parquet
+    else:
+        reader = connection.read_json
+
+    schemas = [reader(path).columns for path in paths]
+    if mismatch := [
+        f"`{file_name}` ({', '.join(columns)})"
+        for file_name, columns in zip(file_names, schemas)
+        if set(columns) != set(schemas[0])
+    ]:
+        raise ValueError(
+            f"Columns of {', '.join(mismatch)} are different from `{file_names[0]}` ({', '.join(schemas[0])})."
+        )
+
+    if not filename_column:
+        relation = reader(paths, union_by_name=True)
+    elif extension == "parquet":
+        # NOTE: Python read_parquet() only takes filename as bool (column named `filename`), the SQL function takes a name
+        path_list = ", ".join(f"'{_quote(path)}'" for path in paths)
+        relation = connection.sql(
+            f"FROM read_parquet([{path_list}], union_by_name = true, filename = '{SOURCE_FILE_COLUMN}')"
+        )
+    else:
+        relation = reader(paths, union_by_name=True, filename=SOURCE_FILE_COLUMN)
+    if filename_column:
+        # Map spooled path back to the uploaded file name
+        file_name_mapping = " ".join(
+            f"WHEN '{_quote(path)}' THEN '{_quote(file_name)}'"
+            for path, file_name in zip(paths, file_names)
+        )
+        relation = relation.project(
+            f'* EXCLUDE ("{SOURCE_FILE_COLUMN}"), CASE "{SOURCE_FILE_COLUMN}" {file_name_mapping} END AS "{filename_column}"'
+        )
+    return {DEFAULT_TABLE_KEY: relation}
@@ -0,0 +1,241 @@
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple, Union
+from collections import OrderedDict
+import itertools
+import os
+import pickle
+import shutil
+import tempfile
+import weakref
+import pandas as pd
+import pyarrow as pa
+from result_viewer import PagedResult
+
+# Default 64 MB (per session)
+DEFAULT_HISTORY_MEMORY_BUDGET = int(
+    os.getenv("DUCKDB_CHAT_HISTORY_MEMORY_BUDGET", 64 * 1024 * 1024)
+)
+# Shown instead of a DataFrame which had to be dropped to stay in budget (see `HistoryStore.enforce_budget()`)
+EVICTED_CONTENT = (
+    "(Result is dropped from the history to save memory, please run the query again.)"
+)
+
+
+class _StoredContent:
+    """
+    Placeholder of a message content kept by the store (in memory or spilled to disk)
+    """
+
+    def __init__(self, content_id: int) -> None:
+        self.content_id = content_id
+
+
+class HistoryStore:
+    """
+    Chat history with bounded memory.
+
+    Message is a dict like `{"role": ..., "content": ..., ...}` (same as before),
+    DataFrame contents are kept as Arrow tables, the least recently used ones are spilled to
+    compressed Arrow IPC files (per session directory) when the memory budget is exceeded,
+    and read back lazily when the message is shown.
+    DataFrames which can't be converted to Arrow (e.g. column of arbitrary Python objects) are pickled instead,
+    if they can't be pickled either, they are dropped (shown as EVICTED_CONTENT), so the budget is never exceeded.
+    Paged results are already spilled when they are created (Arrow IPC snapshot under spill_dir, see `PagedResult`),
+    only their current page is in memory, which is released and read back from the snapshot on demand
+    (never by running the query again).
+
+    Use `content(message)` to get the actual content of a message.
+    """
+
+    def __init__(
+        self,
+        memory_budget: int = DEFAULT_HISTORY_MEMORY_BUDGET,
+        spill_dir: Optional[str] = None,
+    ) -> None:
+        self.memory_budget = memory_budget
+        self.spill_dir = spill_dir or tempfile.mkdtemp(prefix="duckdb_chat_history_")
+        # https://docs.python.org/3/library/weakref.html#weakref.finalize
+        self._finalizer = weakref.finalize(
+            self, shutil.rmtree, self.spill_dir, ignore_errors=True
+        )
+        self.messages: List[dict] = []
+        # content id => Arrow table / DataFrame / PagedResult (in memory, least recently used first)
+        self._in_memory: (
+            "OrderedDict[int, Union[pa.Table, pd.DataFrame, PagedResult]]"
+        ) = OrderedDict()
+        # content id => path of the spilled Arrow IPC file (or pickle of DataFrame which isn't Arrow compatible)
+        self._spilled: Dict[int, str] = {}
+        # content ids of DataFrames dropped to stay in budget (can't be spilled)
+        self._evicted: Set[int] = set()
+        # content id => (rows, columns) of DataFrame or paged result content, known without reading it back
+        self._shapes: Dict[int, Tuple[int, int]] = {}
+        self._ids = itertools.count()
+
+    def __iter__(self) -> Iterator[dict]:
+        return iter(self.messages)
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+    def __getitem__(self, index):
+        return self.messages[index]
+
+    def append(self, message: dict) -> None:
+        content = message.get("content")
+        if isinstance(content, (pd.DataFrame, PagedResult)):
+            content_id = next(self._ids)
+            if isinstance(content, PagedResult):
+                self._shapes[content_id] = (content.row_count, content.column_count)
+            else:
+                self._shapes[content_id] = content.shape
+                try:
+                    content = pa.Table.from_pandas(content)
+                except (
+                    pa.ArrowInvalid,
+                    pa.ArrowTypeError,
+                    pa.ArrowNotImplementedError,
+                ):
+                    # e.g. column of arbitrary Python objects, keep it as is (pickled when spilled)
+                    pass
+            self._in_memory[content_id] = content
+            message = {**message, "content": _StoredContent(content_id)}
+            self.enforce_budget(keep=content_id)
+        self.messages.append(message)
+
+    def extend(self, messages: List[dict]) -> None:
+        for message in messages:
+            self.append(message)
+
+    def clear(self) -> None:
+        self.messages.clear()
+        for value in self._in_memory.values():
+            if isinstance(value, PagedResult):
+                value.close()
+        self._in_memory.clear()
+        for path in self._spilled.values():
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self._spilled.clear()
+        self._evicted.clear()
+        self._shapes.clear()
+
+    def close(self) -> None:
+        self.clear()
+        self._finalizer()
+
+    def shape(self, message: dict) -> Optional[Tuple[int, int]]:
+        """
+        (rows, columns) of DataFrame or paged result content without loading it, None for other content
+        """
+        content = message.get("content")
+        if not isinstance(content, _StoredContent):
+            return None
+        return self._shapes[content.content_id]
+
+    def content(self, message: dict, arrow: bool = False) -> Any:
+        """
+        Actual content of the message (DataFrame is read back from disk if it was spilled)
+        If arrow, DataFrame content is returned as Arrow table when it has no meaningful index
+        (`st.dataframe()` then skips the pandas to Arrow conversion, it still serializes the table on every rerun).
+        """
+        content = message.get("content")
+        if not isinstance(content, _StoredContent):
+            return content
+
+        content_id = content.content_id
+        if content_id in self._evicted:
+            return EVICTED_CONTENT
+        if content_id in self._in_memory:
+            self._in_memory.move_to_end(content_id)
+            value = self._in_memory[content_id]
+        else:
+            path = self._spilled[content_id]
+            if path.endswith(".pkl"):
+                # NOTE: only files written by _spill_pickle() in the session spill directory are unpickled
+                value = pd.read_pickle(path)
+            else:
+                with pa.OSFile(path, "rb") as source:
+                    value = pa.ipc.open_file(source).read_all()
+            self._in_memory[content_id] = value
+            self.enforce_budget(keep=content_id)
+        if isinstance(value, pa.Table) and not (arrow and self._without_index(value)):
+            return value.to_pandas()
+        return value
+
+    @staticmethod
+    def _without_index(table: pa.Table) -> bool:
+        """
+        Index of the original DataFrame is a RangeIndex (kept as metadata instead of a column)
+        """
+        pandas_metadata = table.schema.pandas_metadata or {}
+        return all(
+            isinstance(index_column, dict)
+            for index_column in pandas_metadata.get("index_columns", [])
+        )
+
+    @staticmethod
+    def _size(value: Union[pa.Table, pd.DataFrame, PagedResult]) -> int:
+        if isinstance(value, pa.Table):
+            return value.nbytes
+        if isinstance(value, PagedResult):
+            return value.memory_usage
+        return int(value.memory_usage(index=True, deep=True).sum())
+
+    @property
+    def memory_usage(self) -> int:
+        return sum(self._size(value) for value in self._in_memory.values())
+
+    def _spill(self, content_id: int, table: pa.Table) -> None:
+        if content_id not in self._spilled:
+            # Content never changes, only need to write it once
+            path = os.path.join(self.spill_dir, f"{content_id}.arrow")
+            with pa.OSFile(path, "wb") as sink:
+                with pa.ipc.new_file(
+                    sink,
+                    table.schema,
+                    options=pa.ipc.IpcWriteOptions(compression="zstd"),
+                ) as writer:
+                    writer.write_table(table)
+            self._spilled[content_id] = path
+
+    def _spill_pickle(self, content_id: int, df: pd.DataFrame) -> bool:
+        """
+        Return False if the DataFrame can't be pickled (e.g. holds a lock or a generator)
+        """
+        if content_id not in self._spilled:
+            path = os.path.join(self.spill_dir, f"{content_id}.pkl")
+            try:
+                df.to_pickle(path)
+            except (pickle.PicklingError, TypeError, AttributeError):
+                if os.path.exists(path):
+                    os.remove(path)
+                return False
+            self._spilled[content_id] = path
+        return True
+
+    def enforce_budget(self, keep: Optional[int] = None) -> None:
+        """
+        Spill / release least recently used contents until memory usage is under budget
+        Paged result only releases its page (its snapshot file is already on disk),
+        DataFrame which can be neither spilled as Arrow nor pickled is dropped.
+        """
+        memory_usage = self.memory_usage
+        for content_id in list(self._in_memory):
+            if memory_usage <= self.memory_budget:
+                break
+            if content_id == keep:
+                continue
+            value = self._in_memory[content_id]
+            size = self._size(value)
+            if isinstance(value, pa.Table):
+                self._spill(content_id, value)
+                del self._in_memory[content_id]
+            elif isinstance(value, PagedResult):
+                # Tiny without its page, the page is read back from its snapshot file when shown
+                value.release()
+            else:
+                if not self._spill_pickle(content_id, value):
+                    self._evicted.add(content_id)
+                del self._in_memory[content_id]
+            memory_usage -= size
@@ -0,0 +1,211 @@
+from typing import Callable, Dict, List, Optional, Union
+import functools
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+import duckdb
+from file_loader import FileLike
+
+# Bump this when the parsing logic changed, so old cache entries won't be used
+CACHE_FORMAT_VERSION = 2
+MANIFEST_FILE_NAME = "tables.json"
+DEFAULT_CACHE_DIR = os.getenv(
+    "DUCKDB_CHAT_CACHE_DIR",
+    os.path.join(tempfile.gettempdir(), "duckdb_chat_ingestion_cache"),
+)
+# Default 2 GB
+DEFAULT_CACHE_SIZE_LIMIT = int(
+    os.getenv("DUCKDB_CHAT_CACHE_SIZE_LIMIT", 2 * 1024 * 1024 * 1024)
+)
+# Only formats which are expensive to parse are cached
+# (Parquet is already scanned natively, rewriting it would just be a full read and zstd re-encode before the first query)
+CACHED_EXTENSIONS = {"csv", "json", "xlsx", "xls"}
+
+
+class IngestionCache:
+    """
+    Content-addressed on-disk cache of parsed uploads.
+
+    Key is the hash of the uploaded bytes plus parse options.
+    Each entry is a directory with one Parquet file per table (+ a manifest keeping table order),
+    so a re-upload of a known file is just a `read_parquet()` instead of sniffing and parsing again.
+    Total size is bounded by `size_limit` with LRU eviction (directory mtime is the last access time).
+
+    NOTE: relations are lazy, an entry which is evicted while still being used by another session will fail on next query.
+    Since eviction always removes the least recently used entries first, this should be rare.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str = DEFAULT_CACHE_DIR,
+        size_limit: int = DEFAULT_CACHE_SIZE_LIMIT,
+    ) -> None:
+        """
+        size_limit in bytes, `<= 0` means disable the cache
+        """
+        self.cache_dir = cache_dir
+        self.size_limit = size_limit
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.size_limit > 0
+
+    @staticmethod
+    def cache_key(
+        files: Union[FileLike, List[FileLike]],
+        options: Optional[dict] = None,
+        chunk_size: int = 1 << 20,
+    ) -> str:
+        """
+        files can be a file object (e.g. Streamlit UploadedFile), a file path, or list of them (order matters)
+        """
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(
+            json.dumps(
+                {"version": CACHE_FORMAT_VERSION, **(options or {})},
+                sort_keys=True,
+                default=str,
+            ).encode()
+        )
+        for file in files if isinstance(files, list) else [files]:
+            # Separate files, so content split differently won't collide
+            digest.update(b"\0file\0")
+            if isinstance(file, str):
+                with open(file, "rb") as fp:
+                    while chunk := fp.read(chunk_size):
+                        digest.update(chunk)
+            else:
+                file.seek(0)
+                while chunk := file.read(chunk_size):
+                    digest.update(chunk)
+                file.seek(0)
+        return digest.hexdigest()
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key)
+
+    def get(self, key: str) -> Optional[Dict[str, str]]:
+        """
+        Return table name => Parquet path (in table order) if hit
+        """
+        entry_dir = self._entry_dir(key)
+        try:
+            with open(os.path.join(entry_dir, MANIFEST_FILE_NAME)) as fp:
+                table_names: List[str] = json.load(fp)["tables"]
+            # Mark as recently used
+            os.utime(entry_dir)
+        except (FileNotFoundError, KeyError, json.JSONDecodeError):
+            return None
+        return {
+            table_name: os.path.join(entry_dir, f"{i}.parquet")
+            for i, table_name in enumerate(table_names)
+        }
+
+    def put(
+        self, key: str, relations: Dict[str, duckdb.DuckDBPyRelation]
+    ) -> Dict[str, str]:
+        """
+        Write relations as Parquet and return table name => Parquet path
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # Write into a temp directory then rename, so a half-written entry is never visible
+        temp_dir = os.path.join(self.cache_dir, f".{key}.{uuid.uuid4().hex}")
+        os.makedirs(temp_dir)
+        try:
+            for i, relation in enumerate(relations.values()):
+                relation.write_parquet(
+                    os.path.join(temp_dir, f"{i}.parquet"), compression="zstd"
+                )
+            with open(os.path.join(temp_dir, MANIFEST_FILE_NAME), "w") as fp:
+                json.dump({"tables": list(relations)}, fp)
+            try:
+                os.rename(temp_dir, self._entry_dir(key))
+            except OSError:
+                # Other session just cached the same content
+                shutil.rmtree(temp_dir, ignore_errors=True)
+        except BaseException:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            raise
+
+        self.evict(keep=key)
+        return self.get(key)
+
+    @staticmethod
+    def _dir_size(path: str) -> int:
+        return sum(
+            os.path.getsize(os.path.join(root, file_name))
+            for root, _, file_names in os.walk(path)
+            for file_name in file_names
+        )
+
+    def evict(self, keep: Optional[str] = None) -> None:
+        """
+        Remove least recently used entries until total size is under size_limit
+        """
+        with self._lock:
+            entries = []
+            for key in os.listdir(self.cache_dir):
+                entry_dir = self._entry_dir(key)
+                if key.startswith(".") or not os.path.isdir(entry_dir):
+                    continue
+                try:
+                    entries.append(
+                        (
+                            os.path.getmtime(entry_dir),
+                            key,
+                            self._dir_size(entry_dir),
+                        )
+                    )
+                except FileNotFoundError:
+                    continue
+
+            total_size = sum(size for _, _, size in entries)
+            for _, key, size in sorted(entries):
+                if total_size <= self.size_limit:
+                    break
+                if key == keep:
+                    continue
+                shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+                total_size -= size
+
+    def load(
+        self,
+        files: Union[FileLike, List[FileLike]],
+        loader: Callable[[], Dict[str, duckdb.DuckDBPyRelation]],
+        connection: duckdb.DuckDBPyConnection,
+        options: Optional[dict] = None,
+        key: Optional[str] = None,
+    ) -> Dict[str, duckdb.DuckDBPyRelation]:
+        """
+        Return cached tables (as Parquet scan) if the same content was parsed with the same options before,
+        otherwise parse it with loader and populate the cache.
+        Formats not in CACHED_EXTENSIONS (`options["extension"]`) are always loaded by loader directly.
+        key can be given if it is already computed by `cache_key(files, options)`
+        """
+        if (
+            not self.enabled
+            or (options or {}).get("extension") not in CACHED_EXTENSIONS
+        ):
+            return loader()
+
+        key = key or self.cache_key(files, options)
+        paths = self.get(key)
+        if paths is None:
+            paths = self.put(key, loader())
+        return {
+            table_name: connection.read_parquet(path)
+            for table_name, path in paths.items()
+        }
+
+
+@functools.lru_cache(maxsize=1)
+def get_ingestion_cache() -> IngestionCache:
+    """
+    Process-wide ingestion cache (shared by every session)
+    """
+    return IngestionCache()
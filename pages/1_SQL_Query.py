@@ -2,13 +2,25 @@ import streamlit as st
 import duckdb
 import time
 import pandas as pd
+import pyarrow as pa
 import re
 from utils import QueryRewriterForDuckDB
+from file_loader import get_extension, unique_table_name
+from dataset_registry import get_dataset_registry, get_session_connection
+from result_viewer import DEFAULT_PAGE_SIZE, PagedResult, show_paged_result
+from table_metadata import TableMetadataCache
+from query_cache import QueryResultCache
+from catalog_mirror import CatalogMirror
+from query_executor import run_query
+from history_store import EVICTED_CONTENT, HistoryStore
+from autocomplete import SchemaCompleter
+from streamlit_searchbox import st_searchbox
 
 # import matplotlib.pyplot as plt
 
 
 TEMP_TABLE_NAME = "_temp"
+DATASET_CONSUMER = "sql_query"
 
 # import shutil
 # import os
@@ -44,13 +56,17 @@ with st.expander("Settings"):
         "Print table schema when file is uploaded", False
     )
     auto_initial_table_status = st.checkbox(
-        "Print table statistics (use SUMMARIZE) when file is uploaded", True
+        "Print table statistics (like SUMMARIZE) when file is uploaded", True
     )
     auto_initial_table_status2 = st.checkbox(
-        "Print table statistics (use Pandas) when file is uploaded", False
+        "Print table statistics (like Pandas describe) when file is uploaded", False
     )
     auto_initial_memory_status = st.checkbox(
-        "Show memory consumption of the DataFrame", False
+        "Show memory consumption of the table", False
+    )
+    filename_column = st.text_input(
+        "Column name of the source file name when uploading multiple files (empty means don't add)",
+        "",
     )
     auto_from_table = st.checkbox(
         "Auto add FROM table clause if not found. (Recommend enable to save lots of typing. Disable this if you want to do some debug like `SELECT md5('123')`). Or you can add `;` at the end to temporary disable this.",
@@ -73,6 +89,20 @@ with st.expander("Settings"):
         False,
     )
     row_limit = st.number_input("Maximum rows to show (`<= 0` means no limit)", value=0)
+    page_size = st.number_input(
+        "Rows per page of query result (only the shown page is fetched)",
+        value=DEFAULT_PAGE_SIZE,
+        min_value=1,
+    )
+    query_timeout = st.number_input(
+        "Query timeout in seconds, the query is interrupted if it runs longer (`<= 0` means no limit)",
+        value=60,
+    )
+    history_shown = st.number_input(
+        "Number of latest messages shown in full (older results are collapsed and loaded on demand)",
+        value=20,
+        min_value=1,
+    )
 
 with st.expander("Hints and Syntax"):
     st.markdown(
@@ -129,128 +159,135 @@ with st.expander("Usage"):
         """
     )
 
-if "messages" not in st.session_state:
-    st.session_state.messages = []
+# NOTE: old results are spilled to disk when the history exceeds its memory budget (page specific key, DBQA page use "messages")
+if "sql_query_messages" not in st.session_state:
+    st.session_state.sql_query_messages = HistoryStore()
 
-if "uploaded_file" not in st.session_state:
-    st.session_state.uploaded_file = None
+if "uploaded_files" not in st.session_state:
+    st.session_state.uploaded_files = None
     st.session_state.data = None
-    st.session_state.duckdb_connect = duckdb.connect(
-        config={"allow_unsigned_extensions": "true"}
-    )
-    st.session_state.duckdb_connect.install_extension("httpfs")
-    st.session_state.duckdb_connect.load_extension("httpfs")
-    # st.session_state.duckdb_connect.execute("SET custom_extension_repository='http://welsch.lu/duckdb/prql/latest';")
-    # BUG: duckdb.IOException: IO Error: Failed to download extension "prql" at URL "http://welsch.lu/duckdb/prql/latest/v0.8.1/windows_amd64/prql.duckdb_extension.gz Candidate extensions: "parquet", "sqlite", "sqlite3", "sqlite_scanner" (ERROR Read)
-    # st.session_state.duckdb_connect.execute("FORCE INSTALL prql;")
-    # st.session_state.duckdb_connect.execute("LOAD prql;")
     st.session_state.latest_table = None
-    st.session_state.current_active_tables = set()
 
 
-duckdb_connect = st.session_state.duckdb_connect.cursor()
+# NOTE: uploaded files are parsed once per session and shared with other pages
+# NOTE: use the session connection itself (instead of a cursor) since relations of the registry belong to it
+dataset_registry = get_dataset_registry()
+duckdb_connect = get_session_connection()
+# Tables of this session and their versions (synced from the catalog, query results and metadata are cached by versions)
+if "catalog" not in st.session_state:
+    st.session_state.catalog = CatalogMirror(duckdb_connect)
+catalog: CatalogMirror = st.session_state.catalog
+if "table_metadata" not in st.session_state:
+    st.session_state.table_metadata = TableMetadataCache(duckdb_connect, catalog)
+table_metadata: TableMetadataCache = st.session_state.table_metadata
+if "query_cache" not in st.session_state:
+    st.session_state.query_cache = QueryResultCache()
+query_cache: QueryResultCache = st.session_state.query_cache
+# Names of tables and columns are updated incrementally (only tables whose versions changed are read again)
+if "schema_completer" not in st.session_state:
+    st.session_state.schema_completer = SchemaCompleter(catalog)
+schema_completer: SchemaCompleter = st.session_state.schema_completer
 # duckdb_connect.load_extension("httpfs")
 # duckdb_connect.execute("LOAD prql;")
 
-# TODO: Support multiple file
-# If upload multiple file, they must have same extension and schema.
+# If upload multiple file, they must have same extension and schema (will be loaded as a single table).
 # TODO: Add option that if CSV doesn't have header
-uploaded_file = st.file_uploader(
-    "Data you want to query (support CSV, Parquet, Excel, and Json).",
-    accept_multiple_files=False,
+new_upload = False
+uploaded_files = st.file_uploader(
+    "Data you want to query (support CSV, Parquet, Excel, and Json). Multiple CSV, Parquet, or Json files with the same schema will be loaded as a single table.",
+    accept_multiple_files=True,
 )
 
-if uploaded_file is None:
-    st.session_state.messages = []
+if not uploaded_files:
+    st.session_state.sql_query_messages.clear()
     st.session_state.latest_table = None
-    st.session_state.current_active_tables = set()
+    st.session_state.data = None
+    dataset_registry.release(DATASET_CONSUMER)
 else:
-    if st.session_state.uploaded_file != uploaded_file:
-        st.session_state.messages = []
-        st.session_state.uploaded_file = uploaded_file
+    if st.session_state.uploaded_files != uploaded_files:
+        new_upload = True
+        st.session_state.sql_query_messages.clear()
+        st.session_state.uploaded_files = uploaded_files
         st.session_state.latest_table = default_table_name
-        st.session_state.current_active_tables = {default_table_name}
-
-        if uploaded_file.name.endswith(".csv"):
-            # st.session_state.data = duckdb.read_csv(uploaded_file)
-            try:
-                st.session_state.data = duckdb.read_csv(
-                    uploaded_file, connection=duckdb_connect
-                )
-            except duckdb.InvalidInputException:
-                # BUG
-                # duckdb.InvalidInputException: Invalid Input Error: Error in file "DUCKDB_INTERNAL_OBJECTSTORE://4b3e93e58df2b90e" at line 1 in column "0": Invalid unicode (byte sequence mismatch) detected in CSV file. Parser options:
-                # file=DUCKDB_INTERNAL_OBJECTSTORE://4b3e93e58df2b90e
-                # delimiter=',' (auto detected)
-                # quote='"' (auto detected)
-                # escape='' (auto detected)
-                # header=0 (auto detected)
-                # sample_size=20480
-                # ignore_errors=0
-                # all_varchar=0
-                st.session_state.data = duckdb.read_csv(
-                    uploaded_file, connection=duckdb_connect, encoding="gbk"
-                )
-            except UnicodeDecodeError:
-                st.session_state.data = duckdb.read_csv(
-                    uploaded_file, connection=duckdb_connect, encoding="gbk"
-                )
-        elif uploaded_file.name.endswith(".parquet"):
-            # # TODO: making a LRU file manager for this
-            # # with open(uploaded_file.name, "wb") as destination_file:
-            # #     shutil.copyfileobj(uploaded_file, destination_file)
-            # # https://docs.python.org/3/library/tempfile.html#tempfile.NamedTemporaryFile
-            # # with tempfile.NamedTemporaryFile(suffix=".parquet") as fp:
-            # #     fp.write(uploaded_file.getbuffer())
-            # # NOTE: duckdb won't read file directly, so we should remove them later
-            # # st.session_state.data = duckdb.read_parquet(uploaded_file.name)
-            # st.session_state.data = duckdb.from_df(pd.read_parquet(uploaded_file))
-            # # shutil.rmtree(uploaded_file.name)
-            # # os.remove(uploaded_file.name)
-            st.session_state.data = duckdb.from_df(
-                pd.read_parquet(uploaded_file),
-                connection=duckdb_connect,
-            )
-        elif uploaded_file.name.endswith(".json"):
-            # TODO: haven't tested yet
-            # st.session_state.data = duckdb.read_json(uploaded_file)
-            st.session_state.data = duckdb.read_json(
-                uploaded_file, connection=duckdb_connect
-            )
-        elif uploaded_file.name.endswith(".xlsx") or uploaded_file.name.endswith(
-            ".xls"
-        ):
-            # https://duckdb.org/docs/guides/python/relational_api_pandas.html
-            st.session_state.data = st.session_state.duckdb_connect.from_df(
-                pd.read_excel(uploaded_file)
+        # Every table is (re-)created from the new file
+        table_metadata.clear()
+        query_cache.clear()
+
+        try:
+            # NOTE: parsed tables are also cached on disk by content hash, re-upload a known file won't parse it again
+            # Parquet is scanned with DuckDB native reader
+            # Multiple files are read in parallel by a single DuckDB scan (union by name)
+            dataset = dataset_registry.load(
+                uploaded_files,
+                DATASET_CONSUMER,
+                filename_column=filename_column or None,
             )
-        else:
+        except NotImplementedError:
             st.error("Invalid file extension.")
             st.stop()
+        except (ValueError, duckdb.Error) as e:
+            # e.g. schema of multiple files mismatch, file DuckDB can't parse
+            st.error(e)
+            st.stop()
             # st.session_state.data = None
+        if not dataset.tables:
+            st.error("No data found in the file.")
+            st.stop()
+
+        if get_extension(uploaded_files[0].name) in {"xlsx", "xls"}:
+            # Every sheet become its own table, the first sheet is also the default table
+            sheet_table_names = [default_table_name]
+            for sheet_table_name, relation in dataset.tables.items():
+                sheet_table_name = unique_table_name(sheet_table_name, sheet_table_names)
+                sheet_table_names.append(sheet_table_name)
+                duckdb_connect.register(sheet_table_name, relation)
+        st.session_state.data = dataset.relation()
+
+        # e.g. sniffed CSV encoding and delimiter
+        if parse_options := {
+            key: value
+            for key, value in dataset.parse_options.items()
+            if key != "extension"
+        }:
+            st.session_state.sql_query_messages.append(
+                {
+                    "role": "initial",
+                    "content": f"Parse options of file `{dataset.file_name}`: "
+                    + ", ".join(f"`{key}={value!r}`" for key, value in parse_options.items()),
+                }
+            )
+
+        # NOTE: preview, schema, statistics and memory footprint are computed together in a single scan (and kept with the dataset)
+        profile = (
+            dataset.profile()
+            if auto_initial_table_schema
+            or auto_initial_table_status
+            or auto_initial_table_status2
+            or auto_initial_memory_status
+            else None
+        )
 
         if auto_initial_table:
             # NOTE: currently force preview top 10 rows
-            st.session_state.messages.extend(
+            st.session_state.sql_query_messages.extend(
                 (
                     {
                         "role": "initial",
-                        "content": f"Preview top 10 rows of file `{st.session_state.uploaded_file.name}` (as table alias `{default_table_name}`)",
+                        "content": f"Preview top 10 rows of file `{dataset.file_name}` (as table alias `{default_table_name}`)",
                     },
                     {
                         "role": "assistant",
-                        # "content": st.session_state.data.df()
-                        # if row_limit <= 0
-                        # else st.session_state.data.df().head(row_limit),
-                        "content": st.session_state.data.df().head(10),
+                        "content": (
+                            profile.preview
+                            if profile is not None
+                            else dataset.relation().limit(10).df()
+                        ),
                     },
                 )
             )
 
         if auto_initial_table_schema:
-            # TODO: (Adhoc) we shouldn't register table twice
-            duckdb_connect.register(default_table_name, st.session_state.data)
-            st.session_state.messages.extend(
+            st.session_state.sql_query_messages.extend(
                 (
                     {
                         "role": "initial",
@@ -258,17 +295,13 @@ else:
                     },
                     {
                         "role": "assistant",
-                        "content": duckdb_connect.execute(
-                            f"DESCRIBE {default_table_name};"
-                        ).df(),
+                        "content": profile.schema,
                     },
                 )
             )
 
         if auto_initial_table_status:
-            # TODO: (Adhoc) we shouldn't register table twice
-            duckdb_connect.register(default_table_name, st.session_state.data)
-            st.session_state.messages.extend(
+            st.session_state.sql_query_messages.extend(
                 (
                     {
                         "role": "initial",
@@ -276,14 +309,12 @@ else:
                     },
                     {
                         "role": "assistant",
-                        "content": duckdb_connect.execute(
-                            f"SUMMARIZE {default_table_name};"
-                        ).df(),
+                        "content": profile.summary,
                     },
                 )
             )
         if auto_initial_table_status2:
-            st.session_state.messages.extend(
+            st.session_state.sql_query_messages.extend(
                 (
                     {
                         "role": "initial",
@@ -291,21 +322,21 @@ else:
                     },
                     {
                         "role": "assistant",
-                        "content": st.session_state.data.df().describe(),
+                        "content": profile.describe,
                     },
                 )
             )
 
         if auto_initial_memory_status:
-            st.session_state.messages.extend(
+            st.session_state.sql_query_messages.extend(
                 (
                     {
                         "role": "initial",
-                        "content": f"Memory consumption of `{default_table_name} DataFrame`",
+                        "content": f"Memory consumption of `{default_table_name}` (estimated, in memory)",
                     },
                     {
                         "role": "initial",
-                        "content": f"{st.session_state.data.df().memory_usage(index=False).sum()} bytes.",
+                        "content": f"{profile.memory_usage} bytes.",
                     },
                 )
             )
@@ -313,18 +344,23 @@ else:
 # Create alias for duckdb
 # CatalogException: Catalog Error: Failed to create view 'tbl': Existing object tbl is of type Table, trying to replace with type View
 # tbl = st.session_state.data
-if st.session_state.data is not None:
+# NOTE: only (re-)register when the file is new or the view is missing (e.g. dropped), registering again creates a new object (new version)
+if st.session_state.data is not None and (
+    new_upload
+    or default_table_name not in catalog
+    or (keep_latest_statement_as_last_table and TEMP_TABLE_NAME not in catalog)
+):
     try:
         # This will create VIEW instead of TABLE
         duckdb_connect.register(default_table_name, st.session_state.data)
         if keep_latest_statement_as_last_table:
             duckdb_connect.register(TEMP_TABLE_NAME, st.session_state.data)
-            st.session_state.current_active_tables.add(TEMP_TABLE_NAME)
     except duckdb.CatalogException as e:
         print(e)
+    for table in catalog.sync().changed:
+        query_cache.invalidate(table)
 
-query_rewriter = QueryRewriterForDuckDB(use_view_over_table=use_view_over_table, auto_from_table=auto_from_table, row_limit=row_limit)
-query_rewriter.current_active_tables = st.session_state.current_active_tables
+query_rewriter = QueryRewriterForDuckDB(use_view_over_table=use_view_over_table, auto_from_table=auto_from_table, row_limit=row_limit, catalog=catalog)
 
 # duckdb.alias
 # Not working
@@ -332,7 +368,9 @@ query_rewriter.current_active_tables = st.session_state.current_active_tables
 # exec(f"{default_table_name} = st.session_state.data")
 
 # Rendering history message
-for i, message in enumerate(st.session_state.messages):
+# NOTE: only the latest messages are rendered in full, older results are collapsed into a summary row
+collapse_before = len(st.session_state.sql_query_messages) - history_shown
+for i, message in enumerate(st.session_state.sql_query_messages):
     if message["role"] in {"user", "assistant"}:
         with st.chat_message(message["role"]):
             if message["role"] == "user":
@@ -344,37 +382,75 @@ for i, message in enumerate(st.session_state.messages):
                     st.text("modified:")
                     st.code(message["content"][1], language="sql")
             elif message["role"] == "assistant":
-                if isinstance(message["content"], pd.DataFrame):
-                    if not message.get("time_usage", "is_initial_dfs") is None:
-                        st.dataframe(message["content"])
-                        if show_information and message.get("time_usage"):
-                            row, col = message["content"].shape
-                            st.caption(
-                                f"Time usage: {message['time_usage']:.2f} seconds; Total rows {row}; Total columns {col}."
-                            )
-                    else:
-                        # For EXPLAIN
-                        lines = []
-                        for i, row in message["content"].iterrows():
-                            lines.append(row["explain_key"])
-                            lines.append(row["explain_value"])
-                        st.text("\n".join(lines))
-                else:
-                    # For EXPLAIN (legacy)
-                    if message.get("time_usage", "is_initial_dfs") is None:
-                        st.text(message["content"])
-
-                    else:
-                        st.error(message["content"])
+                if (
+                    i < collapse_before
+                    and (shape := st.session_state.sql_query_messages.shape(message))
+                    and not st.toggle(
+                        f"Show result ({shape[0]} rows, {shape[1]} columns)",
+                        key=f"show_history_{i}",
+                    )
+                ):
+                    continue
+                try:
+                    # Spilled result is read back from disk here
+                    content = st.session_state.sql_query_messages.content(
+                        message, arrow=True
+                    )
+                    if isinstance(content, PagedResult):
+                        show_paged_result(
+                            content,
+                            key=f"result_page_{i}",
+                            show_information=show_information,
+                            time_usage=message.get("time_usage"),
+                            cache_hit=message.get("cache_hit", False),
+                        )
+                    elif content is None:
+                        # Statement without result (e.g. CREATE TABLE, INSERT)
+                        st.success("Statement executed.")
                         if show_information:
-                            st.caption(
-                                f"Time usage: {message['time_usage']:.2f} seconds."
-                            )
+                            st.caption(f"Time usage: {message['time_usage']:.2f} seconds.")
+                    elif isinstance(content, (pd.DataFrame, pa.Table)):
+                        # Arrow table (DataFrame without index) skips the pandas conversion (Streamlit still serializes it)
+                        st.dataframe(content)
+                    elif content is EVICTED_CONTENT:
+                        st.info(content)
+                    else:
+                        # For EXPLAIN (pre-rendered text)
+                        if message.get("time_usage", "is_initial_dfs") is None:
+                            st.text(content)
+
+                        else:
+                            st.error(content)
+                            if show_information:
+                                st.caption(
+                                    f"Time usage: {message['time_usage']:.2f} seconds."
+                                )
+                except (duckdb.Error, OSError, pa.ArrowException) as e:
+                    # e.g. spilled or snapshot file is removed, only this message is affected
+                    st.info(f"Result is no longer available. ({e})")
     else:
         with st.chat_message(name="assistant"):
             if message["role"] == "initial":
                 st.markdown(message["content"])
 
+# Pages fetched by rendering count to the budget too
+st.session_state.sql_query_messages.enforce_budget()
+
+
+def stop_query() -> None:
+    """
+    Callback of the Stop button, the running query is already interrupted when the script rerun
+    """
+    st.session_state.sql_query_messages.append(
+        {
+            "role": "assistant",
+            "content": "Query is stopped.",
+            "time_usage": time.perf_counter()
+            - st.session_state.get("query_start", time.perf_counter()),
+        }
+    )
+
+
 if prompt := st.chat_input(
     "Please input SQL query.", disabled=st.session_state.data is None
 ):
@@ -392,9 +468,7 @@ if prompt := st.chat_input(
         if not prompt.endswith(";"):
             prompt = query_rewriter.rewrite(prompt, st.session_state.latest_table)
 
-        new_table_name = query_rewriter.creating_table(prompt)
-
-        st.session_state.messages.append(
+        st.session_state.sql_query_messages.append(
             {"role": "user", "content": (old_prompt, prompt), "time_usage": None}
         )
         user_message_placeholder.code(old_prompt, language="sql")
@@ -402,18 +476,60 @@ if prompt := st.chat_input(
             modified_placeholder.text("modified:")
             modified_user_message_placeholder.code(prompt, language="sql")
 
+        def execute_prompt():
+            """
+            Run in worker thread (don't call Streamlit here)
+            """
+            # NOTE: relation is None if the statement has no result
+            relation = duckdb_connect.sql(prompt)
+            if relation is None:
+                return None
+            elif "EXPLAIN" in prompt.upper():
+                # https://duckdb.org/docs/guides/meta/explain
+                # Render the plan as text once (instead of keeping a DataFrame and iterrows on every rerun)
+                return "\n".join(
+                    f"{explain_key}\n{explain_value}"
+                    for explain_key, explain_value in relation.fetchall()
+                )
+            # NOTE: the result is snapshotted here (runtime error is caught and it is under timeout),
+            # the history never runs the query again
+            return PagedResult(
+                relation,
+                page_size=page_size,
+                cache=query_cache,
+                # Snapshot files are part of the history spill (removed with it)
+                snapshot_dir=st.session_state.sql_query_messages.spill_dir,
+                # Keyed by the rewritten query plus versions of the tables it reads
+                cache_key=query_cache.key(
+                    prompt, duckdb_connect, catalog.versions
+                ),
+            )
+
+        stop_placeholder = st.empty()
+        # Clicking the button rerun the script, which interrupts the running query
+        stop_placeholder.button("Stop", on_click=stop_query)
+        running_placeholder = st.empty()
+
         with st.spinner():
-            start = time.perf_counter()
+            start = st.session_state.query_start = time.perf_counter()
             # https://www.geeksforgeeks.org/try-except-else-and-finally-in-python/
             try:
-                result = duckdb.execute(prompt, connection=duckdb_connect)
+                # NOTE: query run in worker thread, so it can be interrupted (timeout or Stop button)
+                result = run_query(
+                    duckdb_connect,
+                    execute_prompt,
+                    timeout=query_timeout,
+                    on_wait=lambda elapsed: running_placeholder.caption(
+                        f"Running for {elapsed:.0f} seconds..."
+                    ),
+                )
             except Exception as e:
                 # except duckdb.CatalogException as e:
 
                 # CatalogException
 
                 error = e
-                result_df = None
+                result = None
                 # if new_table_name:
                 #     # Create new table failed, we need to remove table
                 #     # Catalog Error: Table with name "tbl2" already exists!
@@ -425,30 +541,33 @@ if prompt := st.chat_input(
                 # Success
 
                 error = None
-                result_df = result.df()
-                if new_table_name:
-                    # Successfully created new table
-                    st.session_state.current_active_tables.add(new_table_name)
-                    st.session_state.latest_table = new_table_name
+                # Sync tables (and their versions) from the catalog, the created table become the latest table
+                query_rewriter.latest_table = st.session_state.latest_table
+                for table in query_rewriter.after_execute(prompt).changed:
+                    query_cache.invalidate(table)
+                st.session_state.latest_table = query_rewriter.latest_table
             finally:
                 time_usage = time.perf_counter() - start
-                if result_df is not None:
+                stop_placeholder.empty()
+                running_placeholder.empty()
+                if error is None:
                     # TODO: improve this to prevent column contains EXPLAIN etc.
                     # if prompt.upper().startswith("EXPLAIN") and :
-                    if "EXPLAIN" in prompt.upper():
-                        # https://duckdb.org/docs/guides/meta/explain
-                        lines = []
-                        for i, row in result_df.iterrows():
-                            lines.append(row["explain_key"])
-                            lines.append(row["explain_value"])
-                        message_placeholder.text("\n".join(lines))
-                        time_usage = None  # NOTE: (Adhoc) we use time_usage = None to indicate it is a EXPLAIN dataframe
-                    else:
-                        message_placeholder.dataframe(result_df)
+                    if isinstance(result, str):
+                        message_placeholder.text(result)
+                        time_usage = None  # NOTE: (Adhoc) we use time_usage = None to indicate it is a EXPLAIN text
+                    elif result is None:
+                        message_placeholder.success("Statement executed.")
                         if show_information:
-                            row, col = result_df.shape
-                            st.caption(
-                                f"Time usage: {time_usage:.2f} seconds; Total rows {row}; Total columns {col}."
+                            st.caption(f"Time usage: {time_usage:.2f} seconds.")
+                    else:
+                        with message_placeholder.container():
+                            show_paged_result(
+                                result,
+                                key=f"result_page_{len(st.session_state.sql_query_messages)}",
+                                show_information=show_information,
+                                time_usage=time_usage,
+                                cache_hit=result.cache_hit,
                             )
                 else:
                     message_placeholder.error(error)
@@ -456,11 +575,12 @@ if prompt := st.chat_input(
                         st.caption(f"Time usage: {time_usage:.2f} seconds.")
 
     # Update history
-    st.session_state.messages.append(
+    st.session_state.sql_query_messages.append(
         {
             "role": "assistant",
-            "content": result_df if result_df is not None else error,
+            "content": result if error is None else error,
             "time_usage": time_usage,
+            "cache_hit": isinstance(result, PagedResult) and result.cache_hit,
         }
     )
 
@@ -468,22 +588,37 @@ with st.sidebar:
     messages = []
     # TODO: show memory usage..?
     messages.append("Current active tables:")
-    for table in st.session_state.current_active_tables:
+    for table in catalog:
         messages.append(f"- {table}")
     messages.append(f"\nLatest used table: `{st.session_state.latest_table}`")
     if st.session_state.latest_table:
         messages.append("\nPreview:")
     st.markdown("\n".join(messages))
     if st.session_state.latest_table:
-        temp_df = duckdb.sql(
-            f"SELECT * FROM {st.session_state.latest_table};",
-            connection=duckdb_connect,
-        ).df()
-        st.dataframe(temp_df.head(5))
-        row, col = temp_df.shape
-        st.markdown(f"Total rows {row}; Total columns {col}")
-        st.markdown("Available columns:\n")
-        st.write(temp_df.columns)
+        # NOTE: cached until the table is created or replaced (instead of SELECT * on every rerun)
+        try:
+            metadata = table_metadata.get(st.session_state.latest_table)
+        except duckdb.Error as e:
+            st.error(e)
+        else:
+            st.dataframe(metadata.preview)
+            st.markdown(
+                f"Total rows {metadata.row_count}; Total columns {len(metadata.columns)}"
+            )
+            st.markdown("Available columns:\n")
+            st.dataframe(
+                pd.DataFrame({"column": metadata.columns, "type": metadata.types}),
+                hide_index=True,
+            )
+
+    st.markdown("Autocomplete (table, column, function and keyword names):")
+    # https://github.com/m-wrzr/streamlit-searchbox
+    if completed_query := st_searchbox(
+        schema_completer.complete,
+        key="sql_autocomplete",
+        placeholder="Type SQL, the last word is completed",
+    ):
+        st.code(completed_query, language="sql")
 
 # https://pandas.pydata.org/docs/user_guide/visualization.html
 # TODO: support simple plot options for each dataframe
@@ -514,7 +649,7 @@ with st.sidebar:
 #         on_click=partial(
 #             plot_dataframe, st.session_state.latest_result_df, pandas_df_plot_kwargs
 #         ),
-#         key=len(st.session_state.messages),
+#         key=len(st.session_state.sql_query_messages),
 #     )
 #
 #     if click and "figure" in st.session_state and st.session_state.figure is not None:
@@ -1,14 +1,15 @@
 import streamlit as st
-import duckdb
 from langchain.utilities.sql_database import SQLDatabase
-import pandas as pd
-from sqlalchemy import create_engine
-import sqlite3
+from dataset_registry import get_dataset_registry
+from dbqa_database import DBQADatabase
 
 st.set_page_config(page_title="Database Question Answering")
 
 st.title("Database Question Answering")
 
+DATASET_CONSUMER = "dbqa"
+dataset_registry = get_dataset_registry()
+
 table_name = st.text_input(
     "Table Name (better be meaningful and related to the file you uploaded)",
     value="tbl",
@@ -16,12 +17,9 @@ table_name = st.text_input(
 
 if "dbqa_uploaded_file" not in st.session_state:
     st.session_state.dbqa_uploaded_file = None
-    st.session_state.db_engine = create_engine("sqlite:///:memory:")
-    # st.session_state.db_engine = create_engine("sqlite:///temp.db")
-    st.session_state.dbqa_data = None
-
-sqlite_connect = sqlite3.connect(":memory:")
-# sqlite_connect = sqlite3.connect("temp.db")
+    # NOTE: tables are views over the uploaded data in the shared DuckDB instance (no copy into SQLite)
+    st.session_state.dbqa_database = DBQADatabase()
+    st.session_state.dbqa_sql_database = None
 
 uploaded_file = st.file_uploader(
     "Data you want to query (support CSV, Parquet, Excel, and Json).",
@@ -30,38 +28,41 @@ uploaded_file = st.file_uploader(
 
 if uploaded_file is None:
     st.session_state.messages = []
+    st.session_state.dbqa_uploaded_file = None
+    st.session_state.dbqa_database.clear()
+    st.session_state.dbqa_sql_database = None
+    dataset_registry.release(DATASET_CONSUMER)
 else:
     if st.session_state.dbqa_uploaded_file != uploaded_file:
         st.session_state.messages = []
-        st.session_state.dbqa_uploaded_file = uploaded_file
 
-        if uploaded_file.name.endswith(".csv"):
-            try:
-                st.session_state.dbqa_data = pd.read_csv(uploaded_file)
-            except UnicodeDecodeError:
-                st.session_state.dbqa_data = pd.read_csv(uploaded_file, encoding="gbk")
-        elif uploaded_file.name.endswith(".parquet"):
-            st.session_state.dbqa_data = pd.read_parquet(uploaded_file)
-        elif uploaded_file.name.endswith(".xlsx") or uploaded_file.name.endswith(
-            ".xls"
-        ):
-            st.session_state.dbqa_data = pd.read_excel(uploaded_file)
-        else:
+        try:
+            # NOTE: file is parsed once per session and shared with other pages
+            dataset_registry.load(uploaded_file, DATASET_CONSUMER)
+        except NotImplementedError:
             st.error("Please provide valid file.")
             st.stop()
+        except ValueError as e:
+            # e.g. Excel without any data
+            st.error(e)
+            st.stop()
+        st.session_state.dbqa_uploaded_file = uploaded_file
 
-    # ProgrammingError: SQLite objects created in a thread can only be used in that same thread.
-    # st.session_state.dbqa_data.to_sql("tbl", sqlite_connect)
-    st.session_state.dbqa_data.to_sql(table_name, st.session_state.db_engine)
-
-    db = SQLDatabase(
-        st.session_state.db_engine,
-        # Include all table (but seems there will be no previous tables)
-        # include_tables=[table_name],
-        sample_rows_in_table_info=3,
-    )
+    # Registered once per upload (or table name), other tables (i.e. other Excel sheets) are named by sheet name
+    if st.session_state.dbqa_database.register(
+        dataset_registry.get(DATASET_CONSUMER), table_name
+    ):
+        st.session_state.dbqa_sql_database = SQLDatabase(
+            st.session_state.dbqa_database.engine,
+            # Only tables of this upload (the DuckDB instance is shared by every session)
+            schema=st.session_state.dbqa_database.schema,
+            include_tables=st.session_state.dbqa_database.table_names,
+            # Tables are views over the uploaded data (its own file scan)
+            view_support=True,
+            sample_rows_in_table_info=3,
+        )
+    db = st.session_state.dbqa_sql_database
 
-    # st.write(sqlite_connect.execute(f"SELECT * FROM {table_name};").fetchall())
     st.write(db)
     st.write(db.get_table_info())
     st.write(db.get_usable_table_names())
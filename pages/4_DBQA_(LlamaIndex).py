@@ -9,9 +9,8 @@ from llama_index.indices.struct_store import (
 
 # https://docs.llamaindex.ai/en/stable/examples/customization/llms/AzureOpenAI.html
 from llama_index.llms import AzureOpenAI, OpenAI
-import pandas as pd
-from sqlalchemy import create_engine, MetaData
-import sqlite3
+from dataset_registry import get_dataset_registry
+from dbqa_database import DBQADatabase
 from dotenv import load_dotenv
 import os
 
@@ -32,6 +31,9 @@ st.set_page_config(page_title="Database Question Answering (using LlamaIndex)")
 
 st.title("Database Question Answering (using LlamaIndex)")
 
+DATASET_CONSUMER = "dbqa_llamaindex"
+dataset_registry = get_dataset_registry()
+
 table_name = st.text_input(
     "Table Name (better be meaningful and related to the file you uploaded)",
     value="tbl",
@@ -48,12 +50,11 @@ llamaindex_query_engine: Literal[
     "LlamaIndex Query Engine", ["NLSQLTableQueryEngine", "SQLTableRetrieverQueryEngine"]
 )
 
-# sqlite3.ProgrammingError: SQLite objects created in a thread can only be used in that same thread. The object was created in thread id 47584 and this is thread id 15496.
 if "dbqa_llamaindex_uploaded_file" not in st.session_state:
     st.session_state.dbqa_llamaindex_uploaded_file = None
-    st.session_state.dbqa_llamaindex_db_engine = create_engine("sqlite:///:memory:")
-
-sqlite_connect = sqlite3.connect(":memory:")
+    # NOTE: tables are views over the uploaded data in the shared DuckDB instance (no copy into SQLite)
+    st.session_state.dbqa_llamaindex_database = DBQADatabase()
+    st.session_state.dbqa_llamaindex_sql_database = None
 
 uploaded_file = st.file_uploader(
     "Data you want to query (support CSV, Parquet, Excel, and Json).",
@@ -62,42 +63,48 @@ uploaded_file = st.file_uploader(
 
 if uploaded_file is None:
     st.session_state.dbqa_llamaindex_messages = []
-    st.session_state.dbqa_llamaindex_data = None
+    st.session_state.dbqa_llamaindex_uploaded_file = None
+    st.session_state.dbqa_llamaindex_database.clear()
+    st.session_state.dbqa_llamaindex_sql_database = None
+    dataset_registry.release(DATASET_CONSUMER)
 else:
     if st.session_state.dbqa_llamaindex_uploaded_file != uploaded_file:
         st.session_state.dbqa_llamaindex_messages = []
-        st.session_state.dbqa_llamaindex_uploaded_file = uploaded_file
 
-        if uploaded_file.name.endswith(".csv"):
-            try:
-                st.session_state.dbqa_llamaindex_data = pd.read_csv(uploaded_file)
-            except UnicodeDecodeError:
-                st.session_state.dbqa_llamaindex_data = pd.read_csv(
-                    uploaded_file, encoding="gbk"
-                )
-        elif uploaded_file.name.endswith(".parquet"):
-            st.session_state.dbqa_llamaindex_data = pd.read_parquet(uploaded_file)
-        elif uploaded_file.name.endswith(".xlsx") or uploaded_file.name.endswith(
-            ".xls"
-        ):
-            st.session_state.dbqa_llamaindex_data = pd.read_excel(uploaded_file)
-        else:
+        try:
+            # NOTE: file is parsed once per session and shared with other pages
+            dataset_registry.load(uploaded_file, DATASET_CONSUMER)
+        except NotImplementedError:
             st.error("Please provide valid file type.")
             st.stop()
+        except ValueError as e:
+            # e.g. Excel without any data
+            st.error(e)
+            st.stop()
+        st.session_state.dbqa_llamaindex_uploaded_file = uploaded_file
 
-    st.session_state.dbqa_llamaindex_data.to_sql(
-        table_name, st.session_state.dbqa_llamaindex_db_engine
-    )
+    # Registered once per upload (or table name), other tables (i.e. other Excel sheets) are named by sheet name
+    if st.session_state.dbqa_llamaindex_database.register(
+        dataset_registry.get(DATASET_CONSUMER), table_name
+    ):
+        st.session_state.dbqa_llamaindex_sql_database = SQLDatabase(
+            st.session_state.dbqa_llamaindex_database.engine,
+            # Only tables of this upload (the DuckDB instance is shared by every session)
+            schema=st.session_state.dbqa_llamaindex_database.schema,
+            include_tables=st.session_state.dbqa_llamaindex_database.table_names,
+            # Tables are views over the uploaded data (its own file scan)
+            view_support=True,
+        )
 
-# TODO: maybe put these initialization into st.session_state..?
-sql_database = SQLDatabase(st.session_state.dbqa_llamaindex_db_engine)
+sql_database = st.session_state.dbqa_llamaindex_sql_database
 
-if llamaindex_query_engine == "SQLTableRetrieverQueryEngine":
-    metadata_obj = MetaData()
-    metadata_obj.reflect(st.session_state.dbqa_llamaindex_db_engine)
+if (
+    sql_database is not None
+    and llamaindex_query_engine == "SQLTableRetrieverQueryEngine"
+):
     table_node_mapping = SQLTableNodeMapping(sql_database)
     table_schema_objs = []
-    for name in metadata_obj.tables.keys():
+    for name in sql_database.get_usable_table_names():
         table_schema = SQLTableSchema(table_name=name)
         table_schema_objs.append(table_schema)
         st.write(table_schema)
@@ -163,7 +170,7 @@ for msg in st.session_state.dbqa_llamaindex_messages:
 # https://streamlit.io/generative-ai
 # TODO: make response streaming https://docs.streamlit.io/knowledge-base/tutorials/build-conversational-apps#build-a-simple-chatbot-gui-with-streaming
 if prompt := st.chat_input(
-    "Please input question. (Will end with the `additional prompt guide`)", disabled=st.session_state.dbqa_llamaindex_data is None
+    "Please input question. (Will end with the `additional prompt guide`)", disabled=sql_database is None
 ):
     if openai_selection == "OpenAI":
         if not st.session_state.openai_api_key:
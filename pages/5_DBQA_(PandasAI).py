@@ -11,6 +11,7 @@ import pandas as pd
 # https://github.com/pydantic/pydantic/issues/6645
 from pandasai import SmartDataframe, Agent, SmartDatalake
 from pandasai.llm import OpenAI, AzureOpenAI
+from dataset_registry import get_dataset_registry
 
 
 curr_dir = os.path.dirname(os.path.abspath(__file__))
@@ -119,11 +120,14 @@ uploaded_file = st.file_uploader(
 
 # https://docs.streamlit.io/library/advanced-features/static-file-serving
 CHARTS_PATH = os.path.join(curr_dir, "../static/images/")
+DATASET_CONSUMER = "dbqa_pandasai"
+dataset_registry = get_dataset_registry()
 
 if uploaded_file is None:
     st.session_state.dbqa_pandasai_messages = []
     st.session_state.dbqa_pandasai_data = None
     st.session_state.pandasai_df = None
+    dataset_registry.release(DATASET_CONSUMER)
 else:
     config = {
         "llm": llm,
@@ -142,31 +146,30 @@ else:
             st.toast(f"Clean cache image {img_path}")
         st.session_state.temp_images = []
 
-        if uploaded_file.name.endswith(".csv"):
-            try:
-                st.session_state.dbqa_pandasai_data = pd.read_csv(uploaded_file)
-            except UnicodeDecodeError:
-                st.session_state.dbqa_pandasai_data = pd.read_csv(
-                    uploaded_file, encoding="gbk"
-                )
-        elif uploaded_file.name.endswith(".parquet"):
-            st.session_state.dbqa_pandasai_data = pd.read_parquet(uploaded_file)
-        elif uploaded_file.name.endswith(".xlsx") or uploaded_file.name.endswith(
-            ".xls"
-        ):
-            st.session_state.dbqa_pandasai_data = pd.read_excel(uploaded_file)
-        else:
+        try:
+            # NOTE: file is parsed once per session and shared with other pages
+            dataset = dataset_registry.load(uploaded_file, DATASET_CONSUMER)
+        except NotImplementedError:
             st.error("Please provide valid file type.")
             st.stop()
+        except ValueError as e:
+            # e.g. Excel without any data
+            st.error(e)
+            st.stop()
+        st.session_state.dbqa_pandasai_data = dataset.df()
+        # PandasAI (SmartDatalake) can take every table (i.e. Excel sheet) as a DataFrame
+        st.session_state.dbqa_pandasai_dfs = [
+            dataset.df(name) for name in dataset.table_names
+        ]
 
         st.session_state.chat_mode = chat_mode
         if chat_mode == "Single Turn":
             st.session_state.pandasai_df = SmartDatalake(
-                [st.session_state.dbqa_pandasai_data], config=config
+                st.session_state.dbqa_pandasai_dfs, config=config
             )
         elif chat_mode == "Multi Turn":
             st.session_state.pandasai_df = Agent(
-                [st.session_state.dbqa_pandasai_data], config=config
+                st.session_state.dbqa_pandasai_dfs, config=config
             )
 
     if st.session_state.chat_mode != chat_mode:
@@ -174,11 +177,11 @@ else:
         st.session_state.dbqa_pandasai_messages = []
         if chat_mode == "Single Turn":
             st.session_state.pandasai_df = SmartDatalake(
-                [st.session_state.dbqa_pandasai_data], config=config
+                st.session_state.dbqa_pandasai_dfs, config=config
             )
         elif chat_mode == "Multi Turn":
             st.session_state.pandasai_df = Agent(
-                [st.session_state.dbqa_pandasai_data], config=config
+                st.session_state.dbqa_pandasai_dfs, config=config
             )
 
 
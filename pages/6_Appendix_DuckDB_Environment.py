@@ -1,9 +1,11 @@
-from typing import Optional
+from typing import List, Optional
 import streamlit as st
 import duckdb
 from streamlit_searchbox import st_searchbox
 import pandas as pd
-from fast_autocomplete import AutoComplete
+from autocomplete import get_autocomplete_service, get_function_index
+from catalog_snapshot import CatalogSnapshot, get_shared_catalog_snapshot
+from shared_database import get_shared_database, session_object_filter
 
 # streamlit.errors.StreamlitAPIException: `set_page_config()` can only be called once per app page, and must be called as the first Streamlit command in your script.
 st.set_page_config(page_title="Appendix: DuckDB Environment")
@@ -15,17 +17,29 @@ st.title("Appendix: DuckDB Environment")
 """
 
 commands = {}
+# NOTE: the DuckDB instance is shared by every session, only list objects of this session (and built-in / reference ones)
+SESSION_OBJECTS = session_object_filter()
 
+# NOTE: use the session cursor itself, a new cursor won't see the session schema and registered tables
 duckdb_connect: Optional[duckdb.DuckDBPyConnection] = (
-    st.session_state.duckdb_connect.cursor()
-    if "duckdb_connect" in st.session_state
+    st.session_state.duckdb_connect if "duckdb_connect" in st.session_state else None
+)
+# Suggestions include tables of the session, cached suggestions are only reused until the tables change
+autocomplete_context = (
+    (
+        st.session_state.session_database.schema,
+        tuple(sorted(st.session_state.catalog.versions.items()))
+        if "catalog" in st.session_state
+        else (),
+    )
+    if duckdb_connect is not None
     else None
 )
 
 
 def duckdb_autocomplete(
     query: str,  # , duckdb_connect: Optional[duckdb.DuckDBPyConnection]
-) -> pd.Series:
+) -> List[str]:
     """
     https://duckdb.org/docs/extensions/autocomplete.html
 
@@ -39,24 +53,22 @@ def duckdb_autocomplete(
 
     TODO: https://duckdb.org/docs/extensions/full_text_search
     """
-    global duckdb_connect
-    # Table Function with name sql_auto_complete does not exist!
-    template = "FROM sql_auto_complete('{query}');"
-    if duckdb_connect is None:
-        duckdb.install_extension("autocomplete")
-        duckdb.load_extension("autocomplete")
-        return duckdb.execute(template.format(query=query)).df()["suggestion"]
-    else:
-        duckdb_connect.install_extension("autocomplete")
-        duckdb_connect.load_extension("autocomplete")
-        return duckdb_connect.execute(template.format(query=query)).df()["suggestion"]
+    # NOTE: process-wide service, the extension is loaded once and recent suggestions are cached (prefix cache)
+    return get_autocomplete_service().complete(
+        query, connection=duckdb_connect, context=autocomplete_context
+    )
 
 
 if duckdb_connect is not None:
     st.caption("Found DuckDB connection")
-    commands["Tables"] = "SHOW ALL TABLES;"
+    commands["Tables"] = (
+        f"SELECT * FROM (SHOW ALL TABLES) WHERE {session_object_filter('database', 'schema')};"
+    )
 
 st.subheader("Test Auto-Complete")
+# e.g. air-gapped host without the extension bundle (auto-complete has no suggestions without its extension)
+for extension, error in get_shared_database().missing_extensions.items():
+    st.warning(f"Extension `{extension}` is not loaded: {error}")
 # https://github.com/m-wrzr/streamlit-searchbox
 st.write(command := st_searchbox(duckdb_autocomplete, key="duckdb_autocomplete"))
 if command:
@@ -77,61 +89,75 @@ commands.update(
     {
         "Version Number of DuckDB": "SELECT version();",
         "Detail Version Number of DuckDB": "PRAGMA version;",
-        "Columns": "SELECT * FROM duckdb_columns()",
-        "Constraints": "SELECT * FROM duckdb_constraints()",
+        "Columns": f"SELECT * FROM duckdb_columns() WHERE {SESSION_OBJECTS}",
+        "Constraints": f"SELECT * FROM duckdb_constraints() WHERE {SESSION_OBJECTS}",
         "Lists the databases that are accessible from within the current DuckDB process": "SELECT * FROM duckdb_databases()",
         "Dependencies between objects": "SELECT * FROM duckdb_dependencies()",
         "Extensions": "SELECT * FROM duckdb_extensions()",
-        "Functions": "SELECT * FROM duckdb_functions()",
-        "Secondary indexes": "SELECT * FROM duckdb_indexes()",
+        "Functions": f"SELECT * FROM duckdb_functions() WHERE {SESSION_OBJECTS}",
+        "Secondary indexes": f"SELECT * FROM duckdb_indexes() WHERE {SESSION_OBJECTS}",
         "DuckDB's keywords and reversed words": "SELECT * FROM duckdb_keywords()",
         # duckdb.CatalogException: Catalog Error: Table Function with name duckdb_optimizers does not exist!
         # "The available optimization rules in the DuckDB instance": "SELECT * FROM duckdb_optimizers()",
-        "Schemas": "SELECT * FROM duckdb_schemas()",
-        "Sequences": "SELECT * FROM duckdb_sequences()",
+        "Schemas": f"SELECT * FROM duckdb_schemas() WHERE {SESSION_OBJECTS}",
+        "Sequences": f"SELECT * FROM duckdb_sequences() WHERE {SESSION_OBJECTS}",
         "Settings": "SELECT * FROM duckdb_settings()",
-        "Base tables": "SELECT * FROM duckdb_tables()",
-        "Data types": "SELECT * FROM duckdb_types()",
-        "Views": "SELECT * FROM duckdb_views()",
+        "Base tables": f"SELECT * FROM duckdb_tables() WHERE {SESSION_OBJECTS}",
+        "Data types": f"SELECT * FROM duckdb_types() WHERE {SESSION_OBJECTS}",
+        "Views": f"SELECT * FROM duckdb_views() WHERE {SESSION_OBJECTS}",
         "Temporary files": "SELECT * FROM duckdb_temporary_files()",
     }
 )
 
 
-for describe, command in commands.items():
-    st.subheader(describe)
-    st.dataframe(duckdb.execute(command, connection=duckdb_connect).df())
-
-
-def duckdb_func_autocomplete(query: str) -> pd.Series:
+# NOTE: each section is only queried when it is opened, results are kept (per connection) until tables or settings change (DDL or SET)
+if duckdb_connect is not None:
+    if "catalog_snapshot" not in st.session_state:
+        st.session_state.catalog_snapshot = CatalogSnapshot(duckdb_connect)
+    catalog_snapshot: CatalogSnapshot = st.session_state.catalog_snapshot
+    catalog_generation = (
+        st.session_state.catalog.generation if "catalog" in st.session_state else 0
+    )
+else:
+    catalog_snapshot = get_shared_catalog_snapshot()
+    catalog_generation = None
+# e.g. temporary files are changed without any DDL
+if st.button("Refresh"):
+    catalog_snapshot.clear()
+
+for i, (describe, command) in enumerate(commands.items()):
+    # https://docs.streamlit.io/develop/api-reference/layout/st.expander
+    expander = st.expander(describe, key=f"catalog_section_{i}", on_change="rerun")
+    if expander.open:
+        with expander:
+            st.dataframe(catalog_snapshot.get(command, catalog_generation))
+
+
+def duckdb_func_autocomplete(query: str) -> List[str]:
     """
     https://github.com/seperman/fast-autocomplete
     """
-    words = {
-        func: {}
-        for func in duckdb.execute(
-            "SELECT DISTINCT(function_name) AS function_name FROM duckdb_functions();"
-        ).df()["function_name"]
-    }
-    ac = AutoComplete(words=words)
-    print(ac.search(query))
-    return [res[0] for res in ac.search(query)]
+    # NOTE: index of function names and keywords is built once per DuckDB version (persisted and shared), search is in-memory only
+    return get_function_index().search(query)
 
 
 st.divider()
-st.subheader("Function Description")
-st.dataframe(
-    duckdb.execute(
-        "SELECT function_name, FIRST(description) AS description FROM duckdb_functions() WHERE description IS NOT NULL GROUP BY function_name",
-        connection=duckdb_connect,
-    ).df()
+function_description = st.expander(
+    "Function Description", key="function_description", on_change="rerun"
 )
+if function_description.open:
+    with function_description:
+        st.dataframe(
+            pd.DataFrame(
+                [
+                    {"function_name": function_name, "description": description}
+                    for function_name, description in get_function_index().descriptions.items()
+                    if description is not None
+                ]
+            )
+        )
 
 # BUG: somehow this is unstable: crash without error
 st.write(func := st_searchbox(duckdb_func_autocomplete, key="duckdb_func_autocomplete"))
-result = duckdb.execute(
-    f"SELECT function_name, FIRST(description) AS description FROM duckdb_functions() WHERE function_name = '{func}' GROUP BY function_name",
-    connection=duckdb_connect,
-).df()
-if not result.empty:
-    st.write(result["description"][0])
+if description := get_function_index().description(func):
+    st.write(description)
@@ -0,0 +1,164 @@
+from typing import Any, Hashable, Mapping, Optional, Set, Tuple
+from collections import OrderedDict
+import os
+import re
+import threading
+import duckdb
+import pyarrow as pa
+
+# Default 256 MB (per session)
+DEFAULT_QUERY_CACHE_SIZE = int(
+    os.getenv("DUCKDB_CHAT_QUERY_CACHE_SIZE", 256 * 1024 * 1024)
+)
+# Result of these functions changes without any table change (or reads something other than tracked tables)
+VOLATILE_FUNCTION_RE = re.compile(
+    r"\b(random|now|today|current_\w+|get_current_\w+|nextval|currval|setseed|uuid|gen_random_uuid|duckdb_\w+|pragma_\w+|read_\w+|glob)\s*\(",
+    re.IGNORECASE,
+)
+# Identifier token (quoted or not)
+IDENTIFIER_RE = re.compile(r'"((?:[^"]|"")*)"|\w+')
+# Size of non-Arrow values (e.g. row count)
+SCALAR_SIZE = 64
+# Statements that never change any table
+READ_ONLY_STATEMENT_TYPES = {
+    duckdb.StatementType.SELECT,
+    duckdb.StatementType.EXPLAIN,
+    duckdb.StatementType.SET,
+    duckdb.StatementType.VARIABLE_SET,
+}
+
+
+def _identifiers(sql: str) -> Set[str]:
+    """
+    Names of identifier tokens in the SQL
+    https://duckdb.org/docs/api/python/reference/#duckdb.tokenize
+    """
+    identifiers = set()
+    for offset, token_type in duckdb.tokenize(sql):
+        if token_type == duckdb.token_type.identifier and (
+            match := IDENTIFIER_RE.match(sql, offset)
+        ):
+            identifiers.add(
+                match.group(1).replace('""', '"')
+                if match.group(1) is not None
+                else match.group()
+            )
+    return identifiers
+
+
+def may_modify_tables(sql: str) -> bool:
+    """
+    Whether any statement of the SQL may change table content (e.g. INSERT, DROP, ALTER).
+    Tables created or replaced by name should be handled by bumping their versions instead.
+    """
+    try:
+        return any(
+            statement.type not in READ_ONLY_STATEMENT_TYPES
+            for statement in duckdb.extract_statements(sql)
+        )
+    except duckdb.Error:
+        return True
+
+
+class QueryResultCache:
+    """
+    LRU cache of query results (Arrow tables) bounded by memory budget.
+
+    Key is the (rewritten) SQL plus the version of every table it reads,
+    so a result is never used after any of its input tables is created or replaced (version bumped).
+    Only single SELECT statements that read tracked tables only (no volatile function, file scan, or catalog function) are cached.
+    """
+
+    def __init__(self, memory_budget: int = DEFAULT_QUERY_CACHE_SIZE) -> None:
+        """
+        memory_budget in bytes, `<= 0` means disable the cache
+        """
+        self.memory_budget = memory_budget
+        self.size = 0
+        self._entries: "OrderedDict[Hashable, Tuple[Any, int, Set[str]]]" = (
+            OrderedDict()
+        )
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.memory_budget > 0
+
+    def key(
+        self,
+        sql: str,
+        connection: duckdb.DuckDBPyConnection,
+        versions: Mapping[str, int],
+    ) -> Optional[Tuple]:
+        """
+        Return None if the query is not cacheable.
+        versions is table name => version of every tracked table.
+        Tables read by the query are `get_table_names()` (views expanded) plus tracked names used as identifiers,
+        the latter is required for registered objects (e.g. the uploaded `tbl` of SQL Query page) which get_table_names() doesn't report.
+        """
+        if not self.enabled or VOLATILE_FUNCTION_RE.search(sql):
+            return None
+        try:
+            statements = duckdb.extract_statements(sql)
+            if (
+                len(statements) != 1
+                or statements[0].type != duckdb.StatementType.SELECT
+            ):
+                return None
+            # NOTE: views are expanded to the tables they read
+            tables = connection.get_table_names(sql)
+        except duckdb.Error:
+            return None
+        # Registered objects (e.g. uploaded DataFrame or relation) are not reported by get_table_names(),
+        # take the tracked names used in the query as well (a column with the same name only makes the key stricter)
+        tables |= {name for name in _identifiers(sql) if name in versions}
+        if not tables or not tables.issubset(versions):
+            return None
+        return (
+            sql.strip(),
+            tuple(sorted((table, versions[table]) for table in tables)),
+        )
+
+    def get(self, key: Optional[Hashable]) -> Optional[Any]:
+        if key is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key: Optional[Hashable], value: Any) -> None:
+        """
+        Value larger than the whole budget is not cached
+        """
+        if key is None:
+            return
+        size = value.nbytes if isinstance(value, pa.Table) else SCALAR_SIZE
+        if size > self.memory_budget:
+            return
+        tables = {table for table, _ in key[1]}
+        with self._lock:
+            if key in self._entries:
+                self.size -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size, tables)
+            self.size += size
+            while self.size > self.memory_budget:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self.size -= evicted_size
+
+    def invalidate(self, table_name: str) -> None:
+        """
+        Drop results which read the table (they can't be hit anymore after its version is bumped)
+        """
+        with self._lock:
+            for key in [
+                key for key, entry in self._entries.items() if table_name in entry[2]
+            ]:
+                self.size -= self._entries.pop(key)[1]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
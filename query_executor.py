@@ -0,0 +1,137 @@
+from typing import Callable, Optional, TypeVar
+from concurrent.futures import Future, ThreadPoolExecutor
+import asyncio
+import concurrent.futures
+import functools
+import os
+import re
+import time
+import weakref
+import duckdb
+
+# Number of queries run at the same time in the process (shared by every session)
+DEFAULT_QUERY_WORKERS = int(os.getenv("DUCKDB_CHAT_QUERY_WORKERS", 4))
+# Number of queries a session can have (running + waiting), further queries are rejected
+DEFAULT_SESSION_QUERY_LIMIT = int(os.getenv("DUCKDB_CHAT_SESSION_QUERY_LIMIT", 2))
+POLL_INTERVAL = 0.2
+# Seconds to wait for an interrupted query to actually stop
+INTERRUPT_GRACE_PERIOD = 5
+# e.g. `4GB`, `512 MiB`, `1.5GB`
+MEMORY_LIMIT_RE = re.compile(r"\d+(\.\d+)?\s*([KMGT]i?B|B)", re.IGNORECASE)
+
+T = TypeVar("T")
+
+
+@functools.lru_cache(maxsize=1)
+def get_query_executor() -> ThreadPoolExecutor:
+    """
+    Process-wide worker threads for running queries
+    """
+    return ThreadPoolExecutor(
+        max_workers=DEFAULT_QUERY_WORKERS, thread_name_prefix="duckdb_query"
+    )
+
+
+# connection => memory limit last applied by set_memory_limit() (None means DuckDB default)
+_applied_memory_limits: (
+    "weakref.WeakKeyDictionary[duckdb.DuckDBPyConnection, Optional[str]]"
+) = weakref.WeakKeyDictionary()
+
+
+def set_memory_limit(
+    connection: duckdb.DuckDBPyConnection, memory_limit: Optional[str] = None
+) -> None:
+    """
+    memory_limit like `4GB`, None or empty means DuckDB default.
+    Raise ValueError if it is not a size (it is put into the SQL),
+    SET / RESET only runs when the value differs from the last one applied to the connection.
+    NOTE: the limit is of the whole database instance (every cursor of it), not of a connection.
+    https://duckdb.org/docs/configuration/overview
+    """
+    memory_limit = memory_limit.strip() if memory_limit else None
+    if memory_limit and not MEMORY_LIMIT_RE.fullmatch(memory_limit):
+        raise ValueError(f"Invalid memory limit {memory_limit!r} (e.g. 4GB, 512MB).")
+    if (
+        connection in _applied_memory_limits
+        and _applied_memory_limits[connection] == memory_limit
+    ):
+        return
+    if memory_limit:
+        connection.execute(f"SET memory_limit = '{memory_limit}';")
+    else:
+        connection.execute("RESET memory_limit;")
+    _applied_memory_limits[connection] = memory_limit
+
+
+def _interrupt(connection: duckdb.DuckDBPyConnection, future: Future) -> None:
+    if future.cancel():
+        # Still waiting for a worker
+        return
+    connection.interrupt()
+    # Don't let the caller use the connection before the worker leaves it
+    concurrent.futures.wait([future], timeout=INTERRUPT_GRACE_PERIOD)
+
+
+def run_query(
+    connection: duckdb.DuckDBPyConnection,
+    fn: Callable[[], T],
+    timeout: Optional[float] = None,
+    on_wait: Optional[Callable[[float], None]] = None,
+) -> T:
+    """
+    Run fn (which uses the connection) in a worker thread and wait for it.
+    If it takes more than timeout seconds (`None` or `<= 0` means no limit), interrupt the query and raise TimeoutError.
+    on_wait is called with elapsed seconds while waiting, exception raised in it (e.g. Streamlit rerun by the Stop button) also interrupts the query.
+
+    https://duckdb.org/docs/api/python/reference/#duckdb.DuckDBPyConnection.interrupt
+    """
+    start = time.perf_counter()
+    future = get_query_executor().submit(fn)
+    try:
+        while True:
+            try:
+                return future.result(timeout=POLL_INTERVAL)
+            except concurrent.futures.TimeoutError:
+                elapsed = time.perf_counter() - start
+                if timeout and timeout > 0 and elapsed > timeout:
+                    _interrupt(connection, future)
+                    raise TimeoutError(
+                        f"Query is interrupted since it takes more than {timeout} seconds."
+                    )
+                if on_wait is not None:
+                    on_wait(elapsed)
+    finally:
+        if not future.done():
+            _interrupt(connection, future)
+
+
+class SessionQueryLimiter:
+    """
+    Run blocking DuckDB work of a session (e.g. Chainlit) in the process-wide worker threads,
+    so the event loop is not blocked by a slow query of any user.
+
+    The session connection is not thread-safe, so queries of a session run one at a time (others wait),
+    and at most `limit` queries of a session can be running or waiting.
+    """
+
+    def __init__(self, limit: int = DEFAULT_SESSION_QUERY_LIMIT) -> None:
+        self.limit = limit
+        self.pending = 0
+        self._lock = asyncio.Lock()
+
+    async def run(self, fn: Callable[[], T]) -> T:
+        """
+        NOTE: fn runs in another thread, it can't use context of the session (e.g. `cl.user_session`)
+        """
+        if self.pending >= self.limit:
+            raise RuntimeError(
+                f"Too many running queries in this session (limit {self.limit}), please wait for the previous ones."
+            )
+        self.pending += 1
+        try:
+            async with self._lock:
+                return await asyncio.get_running_loop().run_in_executor(
+                    get_query_executor(), fn
+                )
+        finally:
+            self.pending -= 1
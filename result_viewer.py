@@ -0,0 +1,157 @@
+from typing import Iterable, Optional, Tuple
+import math
+import os
+import tempfile
+import weakref
+import duckdb
+import pyarrow as pa
+import streamlit as st
+from file_loader import remove_temp_files
+from query_cache import QueryResultCache
+
+DEFAULT_PAGE_SIZE = 1000
+
+
+class PagedResult:
+    """
+    Snapshot of a query result, shown page by page.
+    The relation is run once when the result is created and streamed (record batch by record batch,
+    so memory is bounded by page_size instead of the result size) into a compressed Arrow IPC file
+    with one record batch per page. Only the page being shown is read back from the file.
+    Arrow table is given to `st.dataframe()` as is, which skips the pandas to Arrow conversion on each rerun
+    (Streamlit still serializes the table to Arrow IPC bytes on every rerun).
+
+    NOTE: the relation is not kept, so every page shows the result as it was when the query ran,
+    even if the tables it read are replaced or dropped afterwards (the whole result is written once, instead of LIMIT / OFFSET on demand).
+
+    The file is created under snapshot_dir (system temp directory by default) and removed when the result is garbage collected.
+    If cache and cache_key (see `QueryResultCache.key()`) are given, a result which fits in one page is looked up in the cache first
+    (the query is not run on hit). Larger results are not cached, their snapshot is per result.
+    """
+
+    def __init__(
+        self,
+        relation: duckdb.DuckDBPyRelation,
+        page_size: int = DEFAULT_PAGE_SIZE,
+        cache: Optional[QueryResultCache] = None,
+        cache_key: Optional[Tuple] = None,
+        snapshot_dir: Optional[str] = None,
+    ) -> None:
+        self.page_size = max(int(page_size), 1)
+        self.columns = relation.columns
+        self.row_count = 0
+        self._page_number: Optional[int] = None
+        self._page: Optional[pa.Table] = None
+
+        fd, self.path = tempfile.mkstemp(
+            suffix=".arrow", prefix="duckdb_chat_result_", dir=snapshot_dir
+        )
+        os.close(fd)
+        # https://docs.python.org/3/library/weakref.html#weakref.finalize
+        self._finalizer = weakref.finalize(self, remove_temp_files, [self.path])
+
+        key = (
+            (*cache_key, "page", self.page_size)
+            if cache is not None and cache_key is not None
+            else None
+        )
+        arrow_table = cache.get(key) if key else None
+        # Whether the result is served from cache (the query didn't run)
+        self.cache_hit = arrow_table is not None
+        if arrow_table is not None:
+            self._write(arrow_table.schema, arrow_table.combine_chunks().to_batches())
+        else:
+            # NOTE: batches are exactly page_size rows (except the last one), so a page is a record batch
+            reader = relation.to_arrow_reader(self.page_size)
+            self._write(reader.schema, reader)
+            if key and self.row_count <= self.page_size:
+                cache.put(key, self.page(0))
+
+    def _write(self, schema: pa.Schema, batches: Iterable[pa.RecordBatch]) -> None:
+        with pa.OSFile(self.path, "wb") as sink:
+            with pa.ipc.new_file(
+                sink,
+                schema,
+                options=pa.ipc.IpcWriteOptions(compression="zstd"),
+            ) as writer:
+                for batch in batches:
+                    writer.write_batch(batch)
+                    self.row_count += batch.num_rows
+
+    def page(self, page_number: int = 0) -> pa.Table:
+        """
+        page_number starts from 0, only the latest read page is kept
+        """
+        if page_number != self._page_number:
+            with pa.OSFile(self.path, "rb") as source:
+                reader = pa.ipc.open_file(source)
+                if reader.num_record_batches:
+                    self._page = pa.Table.from_batches([reader.get_batch(page_number)])
+                else:
+                    self._page = reader.schema.empty_table()
+            self._page_number = page_number
+        return self._page
+
+    @property
+    def memory_usage(self) -> int:
+        """
+        Bytes of the page kept in memory
+        """
+        return self._page.nbytes if self._page is not None else 0
+
+    def release(self) -> None:
+        """
+        Drop the page kept in memory, it is read from the snapshot file again when requested
+        """
+        self._page_number = None
+        self._page = None
+
+    def close(self) -> None:
+        """
+        Remove the snapshot file (the result can't be shown anymore)
+        """
+        self.release()
+        self._finalizer()
+
+    @property
+    def column_count(self) -> int:
+        return len(self.columns)
+
+    @property
+    def page_count(self) -> int:
+        return max(math.ceil(self.row_count / self.page_size), 1)
+
+
+def show_paged_result(
+    result: PagedResult,
+    key: str,
+    show_information: bool = True,
+    time_usage: Optional[float] = None,
+    cache_hit: bool = False,
+) -> None:
+    """
+    Render the selected page of the result, with a page selector if there are more than one page.
+    key should be unique of the result (used as widget key).
+    """
+    page_number = 0
+    if result.page_count > 1:
+        page_number = (
+            st.number_input(
+                f"Page (of {result.page_count}, {result.page_size} rows per page)",
+                min_value=1,
+                max_value=result.page_count,
+                value=1,
+                key=key,
+            )
+            - 1
+        )
+    st.dataframe(result.page(page_number))
+    if show_information:
+        st.caption(
+            (
+                f"Time usage: {time_usage:.2f} seconds{' (cache hit)' if cache_hit else ''}; "
+                if time_usage
+                else ""
+            )
+            + f"Total rows {result.row_count}; Total columns {result.column_count}."
+        )
@@ -0,0 +1,220 @@
+"""
+Process-wide DuckDB instance shared by every session (Streamlit session / Chainlit chat)
+
+NOTE: session schemas only separate names, they don't restrict access.
+DuckDB has no users nor permissions, any session can still read or drop objects of another session by qualified name
+(e.g. `SELECT * FROM session_2.tbl`, `DROP SCHEMA session_0 CASCADE`),
+and instance-wide state (global settings, secrets, attached databases) is shared by everyone.
+Only deploy it for users who trust each other.
+Things that belong to a cursor (temporary objects and macros, session settings, prepared statements, registered objects)
+are isolated, since a cursor is never handed to another session.
+"""
+
+from typing import Dict, List, Optional
+import functools
+import itertools
+import logging
+import os
+import threading
+import weakref
+import duckdb
+from query_executor import set_memory_limit
+
+# Memory limit of the shared DuckDB instance (all sessions together), e.g. `8GB`, empty means DuckDB default
+DEFAULT_MEMORY_LIMIT = os.getenv("DUCKDB_CHAT_MEMORY_LIMIT", "")
+# Comma separated DuckDB database files attached read-only once for every session (named by file name)
+REFERENCE_DATABASES = os.getenv("DUCKDB_CHAT_REFERENCE_DATABASES", "")
+# Number of fresh (never used) cursors kept ready for new sessions
+DEFAULT_CURSOR_POOL_SIZE = int(os.getenv("DUCKDB_CHAT_CURSOR_POOL_SIZE", 16))
+SESSION_SCHEMA_PREFIX = "session_"
+# Extensions loaded once per process (every cursor inherits them), comma separated
+DEFAULT_EXTENSIONS = os.getenv("DUCKDB_CHAT_EXTENSIONS", "httpfs,autocomplete")
+
+logger = logging.getLogger(__name__)
+# Pre-populated extension directory (see bundle_extensions.py), empty means DuckDB default (~/.duckdb/extensions)
+EXTENSION_DIRECTORY = os.getenv("DUCKDB_CHAT_EXTENSION_DIR", "")
+# Local extension repository to install missing extensions from, empty means never install (nothing is downloaded)
+EXTENSION_REPOSITORY = os.getenv("DUCKDB_CHAT_EXTENSION_REPOSITORY", "")
+
+
+def _quote_identifier(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def session_object_filter(
+    database_column: str = "database_name", schema_column: str = "schema_name"
+) -> str:
+    """
+    SQL predicate of catalog objects (e.g. rows of `duckdb_tables()`) a session should list:
+    its own schema, temporary objects (of its cursor) and other databases (i.e. built-in and attached reference databases),
+    but not other schemas of the shared database (e.g. other sessions)
+    """
+    return f"({database_column} <> current_database() OR {schema_column} = current_schema())"
+
+
+class SessionDatabase:
+    """
+    Part of the shared DuckDB instance owned by a session:
+    its own schema (unqualified tables and views are created and looked up there) and a cursor from the pool
+    (registered DataFrames / relations and temporary objects belong to the cursor, so other sessions can't see them).
+
+    Released (schema dropped, cursor closed) by `close()` or when it is garbage collected (e.g. session ended).
+    """
+
+    def __init__(
+        self,
+        database: "SharedDatabase",
+        schema: str,
+        cursor: duckdb.DuckDBPyConnection,
+    ) -> None:
+        self.schema = schema
+        self.cursor = cursor
+        # https://docs.python.org/3/library/weakref.html#weakref.finalize
+        self._finalizer = weakref.finalize(self, database.release, schema, cursor)
+
+    def close(self) -> None:
+        self._finalizer()
+
+
+class SharedDatabase:
+    """
+    Process-wide DuckDB instance shared by every session,
+    so buffer pool, worker threads, extensions and reference databases are not duplicated per session.
+
+    Extensions are loaded from the local extension directory once, automatic install (download) is disabled,
+    an extension which is not found is skipped (recorded in `missing_extensions`).
+    The pool only keeps fresh cursors: a released cursor is closed (with everything of the session in it) instead of reused.
+
+    https://duckdb.org/docs/api/python/overview#using-connections-in-parallel-python-programs
+    https://duckdb.org/docs/extensions/working_with_extensions
+    """
+
+    def __init__(
+        self,
+        database: str = ":memory:",
+        memory_limit: Optional[str] = DEFAULT_MEMORY_LIMIT,
+        reference_databases: Optional[List[str]] = None,
+        pool_size: int = DEFAULT_CURSOR_POOL_SIZE,
+        extensions: Optional[List[str]] = None,
+        extension_directory: Optional[str] = EXTENSION_DIRECTORY,
+        extension_repository: Optional[str] = EXTENSION_REPOSITORY,
+    ) -> None:
+        config = {
+            "allow_unsigned_extensions": "true",
+            # Air-gapped hosts: never download extensions
+            "autoinstall_known_extensions": "false",
+            "autoload_known_extensions": "true",
+        }
+        if extension_directory:
+            config["extension_directory"] = extension_directory
+        self.connection = duckdb.connect(database, config=config)
+        # NOTE: memory limit is of the whole instance (can't be set per session)
+        set_memory_limit(self.connection, memory_limit)
+        self.database_name = self.connection.execute(
+            "SELECT current_database();"
+        ).fetchone()[0]
+        self.pool_size = pool_size
+        self._idle_cursors: List[duckdb.DuckDBPyConnection] = []
+        self._schema_ids = itertools.count()
+        self._lock = threading.Lock()
+        self.extension_repository = extension_repository
+        self.loaded_extensions: List[str] = []
+        # name => error
+        self.missing_extensions: Dict[str, str] = {}
+        for extension in extensions or []:
+            self.load_extension(extension)
+        # name => path
+        self.reference_databases: Dict[str, str] = {}
+        for path in reference_databases or []:
+            self.attach_reference(path)
+
+    def load_extension(self, name: str) -> bool:
+        """
+        Load the extension for the whole instance (install from the local repository first if it is not found)
+        """
+        with self._lock:
+            try:
+                self.connection.load_extension(name)
+            except duckdb.Error as e:
+                if not self.extension_repository:
+                    logger.warning("Extension %s is not loaded: %s", name, e)
+                    self.missing_extensions[name] = str(e)
+                    return False
+                try:
+                    self.connection.execute(
+                        f"INSTALL {name} FROM '{self.extension_repository}';"
+                    )
+                    self.connection.load_extension(name)
+                except duckdb.Error as e:
+                    logger.warning("Extension %s is not loaded: %s", name, e)
+                    self.missing_extensions[name] = str(e)
+                    return False
+            self.missing_extensions.pop(name, None)
+            self.loaded_extensions.append(name)
+            return True
+
+    def attach_reference(self, path: str, name: Optional[str] = None) -> str:
+        """
+        Attach a DuckDB database file read-only (once for every session), tables are queried as `name.table`
+
+        https://duckdb.org/docs/sql/statements/attach
+        """
+        name = name or os.path.splitext(os.path.basename(path))[0]
+        with self._lock:
+            self.connection.execute(
+                f"ATTACH IF NOT EXISTS '{path}' AS {_quote_identifier(name)} (READ_ONLY);"
+            )
+            self.reference_databases[name] = path
+        return name
+
+    def acquire(self) -> SessionDatabase:
+        with self._lock:
+            schema = f"{SESSION_SCHEMA_PREFIX}{next(self._schema_ids)}"
+            cursor = (
+                self._idle_cursors.pop()
+                if self._idle_cursors
+                else self.connection.cursor()
+            )
+        qualified_schema = (
+            f"{_quote_identifier(self.database_name)}.{_quote_identifier(schema)}"
+        )
+        cursor.execute(f"CREATE SCHEMA {qualified_schema};")
+        cursor.execute(f"USE {qualified_schema};")
+        return SessionDatabase(self, schema, cursor)
+
+    def release(self, schema: str, cursor: duckdb.DuckDBPyConnection) -> None:
+        """
+        Drop everything of the session: its cursor is closed (temporary objects, macros, session settings
+        and prepared statements go with it, resetting them one by one would miss some), then its schema is dropped.
+        A fresh cursor is put into the pool for the next session.
+        """
+        try:
+            cursor.close()
+        except duckdb.Error:
+            logger.exception("Failed to close the cursor of session schema %s", schema)
+        maintenance_cursor = self.connection.cursor()
+        try:
+            maintenance_cursor.execute(
+                f"DROP SCHEMA IF EXISTS {_quote_identifier(self.database_name)}.{_quote_identifier(schema)} CASCADE;"
+            )
+        except duckdb.Error:
+            logger.exception("Failed to drop session schema %s", schema)
+        finally:
+            maintenance_cursor.close()
+        with self._lock:
+            if len(self._idle_cursors) < self.pool_size:
+                self._idle_cursors.append(self.connection.cursor())
+
+
+@functools.lru_cache(maxsize=1)
+def get_shared_database() -> SharedDatabase:
+    return SharedDatabase(
+        extensions=[
+            extension.strip()
+            for extension in DEFAULT_EXTENSIONS.split(",")
+            if extension.strip()
+        ],
+        reference_databases=[
+            path.strip() for path in REFERENCE_DATABASES.split(",") if path.strip()
+        ],
+    )
@@ -0,0 +1,50 @@
+from typing import Dict, List, NamedTuple, Tuple
+import duckdb
+import pandas as pd
+from catalog_mirror import CatalogMirror
+
+PREVIEW_ROWS = 5
+
+
+class TableMetadata(NamedTuple):
+    columns: List[str]
+    types: List[str]
+    row_count: int
+    preview: pd.DataFrame
+
+
+class TableMetadataCache:
+    """
+    Metadata of tables (columns, row count, first few rows) for the sidebar panel.
+    Computed by catalog lookup (binding only), a count and a LIMIT query (instead of `SELECT *` into pandas),
+    and cached by table version (of the catalog mirror), so it is only computed again after the table is changed.
+    """
+
+    def __init__(
+        self, connection: duckdb.DuckDBPyConnection, catalog: CatalogMirror
+    ) -> None:
+        self.connection = connection
+        self.catalog = catalog
+        self._metadata: Dict[str, Tuple[int, TableMetadata]] = {}
+
+    def clear(self) -> None:
+        self._metadata.clear()
+
+    def get(self, table_name: str) -> TableMetadata:
+        """
+        Raise duckdb.Error if the table doesn't exist (anymore)
+        """
+        version = self.catalog.versions.get(table_name, 0)
+        cached = self._metadata.get(table_name)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        relation = self.connection.table(table_name)
+        metadata = TableMetadata(
+            columns=relation.columns,
+            types=[str(column_type) for column_type in relation.types],
+            row_count=relation.aggregate("count(*)").fetchone()[0],
+            preview=relation.limit(PREVIEW_ROWS).df(),
+        )
+        self._metadata[table_name] = (version, metadata)
+        return metadata
@@ -0,0 +1,177 @@
+from typing import List, NamedTuple
+import duckdb
+import pandas as pd
+
+PREVIEW_ROWS = 10
+NUMERIC_TYPES = {
+    "TINYINT",
+    "SMALLINT",
+    "INTEGER",
+    "BIGINT",
+    "HUGEINT",
+    "UTINYINT",
+    "USMALLINT",
+    "UINTEGER",
+    "UBIGINT",
+    "UHUGEINT",
+    "FLOAT",
+    "DOUBLE",
+}
+# Byte width of fixed size types (for memory footprint estimation), others are treated as variable size
+FIXED_TYPE_WIDTHS = {
+    "BOOLEAN": 1,
+    "TINYINT": 1,
+    "UTINYINT": 1,
+    "SMALLINT": 2,
+    "USMALLINT": 2,
+    "INTEGER": 4,
+    "UINTEGER": 4,
+    "FLOAT": 4,
+    "DATE": 4,
+    "BIGINT": 8,
+    "UBIGINT": 8,
+    "DOUBLE": 8,
+    "TIME": 8,
+    "TIMESTAMP": 8,
+    "TIMESTAMP WITH TIME ZONE": 8,
+    "INTERVAL": 16,
+    "HUGEINT": 16,
+    "UHUGEINT": 16,
+    "UUID": 16,
+}
+VARIABLE_TYPES = {"VARCHAR", "BLOB", "BIT"}
+STATISTICS = ["min", "max", "approx_unique", "avg", "std", "q25", "q50", "q75", "count"]
+
+
+class TableProfile(NamedTuple):
+    """
+    summary: similar to `SUMMARIZE` (one row per column)
+    describe: similar to `pd.DataFrame.describe()` (numeric columns only)
+    memory_usage: estimated bytes of the table in memory (Arrow layout)
+    """
+
+    row_count: int
+    preview: pd.DataFrame
+    schema: pd.DataFrame
+    summary: pd.DataFrame
+    describe: pd.DataFrame
+    memory_usage: int
+
+
+def _quote_identifier(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _is_numeric(column_type: str) -> bool:
+    return column_type in NUMERIC_TYPES or column_type.startswith("DECIMAL")
+
+
+def _column_aggregates(column: str, column_type: str) -> List[str]:
+    """
+    Aggregate expressions of a column, same order as STATISTICS + [memory]
+    """
+    quoted = _quote_identifier(column)
+    is_nested = column_type.endswith("[]") or column_type.startswith(
+        ("STRUCT", "MAP", "UNION")
+    )
+    if is_nested:
+        aggregates = ["NULL", "NULL", "NULL"]
+    else:
+        aggregates = [
+            f"min({quoted})::VARCHAR",
+            f"max({quoted})::VARCHAR",
+            f"approx_count_distinct({quoted})",
+        ]
+    if _is_numeric(column_type):
+        aggregates += [
+            f"avg({quoted})",
+            f"stddev_samp({quoted})",
+            *(
+                f"approx_quantile({quoted}::DOUBLE, {quantile})"
+                for quantile in (0.25, 0.5, 0.75)
+            ),
+        ]
+    else:
+        aggregates += ["NULL"] * 5
+    aggregates.append(f"count({quoted})")
+
+    if column_type in FIXED_TYPE_WIDTHS:
+        aggregates.append(f"{FIXED_TYPE_WIDTHS[column_type]} * count(*)")
+    elif column_type.startswith("DECIMAL"):
+        aggregates.append("16 * count(*)")
+    elif column_type in VARIABLE_TYPES:
+        # Data + 4 bytes offset per row
+        aggregates.append(
+            f"coalesce(sum(octet_length({quoted}::BLOB)), 0) + 4 * count(*)"
+        )
+    else:
+        # Nested type: rough estimation by its text representation
+        aggregates.append(f"coalesce(sum(strlen({quoted}::VARCHAR)), 0)")
+    return aggregates
+
+
+def profile_table(
+    relation: duckdb.DuckDBPyRelation, preview_rows: int = PREVIEW_ROWS
+) -> TableProfile:
+    """
+    Compute summary statistics and memory footprint of every column in a single aggregate query (one scan),
+    plus a LIMIT query for preview, without materializing the table into pandas.
+    """
+    columns = relation.columns
+    types = [str(column_type) for column_type in relation.types]
+    aggregates = ["count(*)"]
+    for column, column_type in zip(columns, types):
+        aggregates += _column_aggregates(column, column_type)
+    values = relation.aggregate(", ".join(aggregates)).fetchone()
+
+    row_count = values[0]
+    width = len(STATISTICS) + 1
+    column_values = [
+        values[1 + i * width : 1 + (i + 1) * width] for i in range(len(columns))
+    ]
+
+    summary = pd.DataFrame(
+        [
+            {
+                "column_name": column,
+                "column_type": column_type,
+                **dict(zip(STATISTICS, column_value[:-1])),
+                "null_percentage": (
+                    100 * (1 - column_value[len(STATISTICS) - 1] / row_count)
+                    if row_count
+                    else None
+                ),
+            }
+            for column, column_type, column_value in zip(columns, types, column_values)
+        ]
+    )
+
+    numeric_columns = [
+        i for i, column_type in enumerate(types) if _is_numeric(column_type)
+    ]
+    describe = pd.DataFrame(
+        {
+            columns[i]: {
+                "count": column_values[i][8],
+                "mean": column_values[i][3],
+                "std": column_values[i][4],
+                "min": column_values[i][0],
+                "25%": column_values[i][5],
+                "50%": column_values[i][6],
+                "75%": column_values[i][7],
+                "max": column_values[i][1],
+            }
+            for i in numeric_columns
+        }
+    )
+    # min / max are VARCHAR (to be generic), cast back for numeric columns
+    describe = describe.apply(pd.to_numeric, errors="coerce")
+
+    return TableProfile(
+        row_count=row_count,
+        preview=relation.limit(preview_rows).df(),
+        schema=pd.DataFrame({"column_name": columns, "column_type": types}),
+        summary=summary,
+        describe=describe,
+        memory_usage=int(sum(column_value[-1] or 0 for column_value in column_values)),
+    )
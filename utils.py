@@ -1,10 +1,139 @@
-from typing import Any, Set, Optional
+from typing import Set, Optional
+import functools
 import re
+import duckdb
+from catalog_mirror import CatalogChange, CatalogMirror
+
+# Queries start with these keywords are statements, won't be wrapped as `SELECT ...`
+STATEMENT_KEYWORDS = {
+    "ALTER",
+    "ANALYZE",
+    "ATTACH",
+    "BEGIN",
+    "CALL",
+    "CHECKPOINT",
+    "COMMIT",
+    "COPY",
+    "CREATE",
+    "DEALLOCATE",
+    "DELETE",
+    "DESCRIBE",
+    "DETACH",
+    "DROP",
+    "EXECUTE",
+    "EXPLAIN",
+    "EXPORT",
+    "FROM",
+    "IMPORT",
+    "INSERT",
+    "INSTALL",
+    "LOAD",
+    "PIVOT",
+    "PRAGMA",
+    "PREPARE",
+    "RESET",
+    "ROLLBACK",
+    "SELECT",
+    "SET",
+    "SHOW",
+    "SUMMARIZE",
+    "TABLE",
+    "UNPIVOT",
+    "UPDATE",
+    "USE",
+    "VACUUM",
+    "VALUES",
+    "WITH",
+}
+WORD_RE: re.Pattern = re.compile(r"\w+")
+REWRITE_CACHE_SIZE = 1024
+
+
+@functools.lru_cache(maxsize=REWRITE_CACHE_SIZE)
+def rewrite_query(
+    query: str,
+    latest_table: Optional[str],
+    is_table_name: bool,
+    use_view_over_table: bool = False,
+    auto_from_table: bool = True,
+    row_limit: int = 0,
+) -> str:
+    """
+    Rewrite query based on tokens of DuckDB tokenizer (single pass, keywords inside string literal or identifier are ignored).
+    It is a pure function of its arguments, so result is memoized (LRU), repeated queries skip rewriting.
+    is_table_name means the whole query is the name of an active table.
+
+    https://duckdb.org/docs/api/python/reference/#duckdb.tokenize
+    """
+    tokens = duckdb.tokenize(query)
+
+    if (
+        len(tokens) >= 3
+        # NOTE: common names (e.g. data, name, value, year) are keyword tokens
+        and (
+            tokens[0][1] == duckdb.token_type.identifier
+            or (
+                tokens[0][1] == duckdb.token_type.keyword
+                and WORD_RE.fullmatch(query[tokens[0][0] : tokens[1][0]].strip())
+                and query[tokens[0][0] : tokens[1][0]].strip().upper()
+                not in STATEMENT_KEYWORDS
+            )
+        )
+        and tokens[1][1] == duckdb.token_type.operator
+        and query[tokens[1][0] : tokens[2][0]].strip() == "="
+    ):
+        # Create table alias: `new_table_name = ...`
+        # https://duckdb.org/docs/sql/statements/create_table.html
+        latest_table_name = query[tokens[0][0] : tokens[1][0]].strip()
+        expression = query[tokens[2][0] :]
+        # NOTE: use OR REPLACE can support same table name override
+        # https://duckdb.org/docs/sql/statements/create_view.html
+        query = f"CREATE OR REPLACE {'VIEW' if use_view_over_table else 'TABLE'} {latest_table_name} AS {expression}"
+        tokens = duckdb.tokenize(query)
+
+    keywords = [
+        (offset, WORD_RE.match(query, offset).group().upper())
+        for offset, token_type in tokens
+        if token_type == duckdb.token_type.keyword
+    ]
+    select_offsets = [offset for offset, keyword in keywords if keyword == "SELECT"]
+
+    if (
+        auto_from_table
+        and select_offsets
+        and not any(keyword == "FROM" for _, keyword in keywords)
+    ):
+        for offset in reversed(select_offsets):
+            query = f"{query[:offset]}FROM {latest_table} {query[offset:]}"
+
+    if not select_offsets:
+        first_word = WORD_RE.match(query, tokens[0][0]) if tokens else None
+        if is_table_name:
+            # query is table name
+            # If only table name (without SELECT and FROM), then by default just output the table
+            query = f"FROM {query.strip()} SELECT *;"
+        elif first_word is None or first_word.group().upper() not in STATEMENT_KEYWORDS:
+            # https://duckdb.org/docs/sql/functions/char.html
+            # https://duckdb.org/docs/sql/functions/patternmatching.html
+            # Special case, query is a quick test
+            query = f"SELECT {query};"
+
+    # TODO: if use aggregate function but without GROUP BY, automatically inference columns
+    # BinderException: Binder Error: column "symbol" must appear in the GROUP BY clause or must be part of an aggregate function.
+    # Either add it to the GROUP BY list, or use "ANY_VALUE(symbol)" if the exact value of "symbol" is not important.
+
+    # TODO: not sure if this part make sense. Ideally, user should be aware of what they are doing.
+    # (operation can cancel when it took too much time)
+    query = query.rstrip().rstrip(";").rstrip()
+    if row_limit > 0:
+        query += f" LIMIT {row_limit}"
+
+    # This is not necessary but will make description seems complete
+    return query + ";"
 
 
 class QueryRewriterForDuckDB:
     latest_table: str
-    current_active_tables: Set[str] = set()
 
     create_table_alias_re: re.Pattern = re.compile(r"(?i)^(\w+)\s*=\s*(.*)")
     create_table_name_re: re.Pattern = re.compile(
@@ -20,9 +149,11 @@ class QueryRewriterForDuckDB:
         row_limit: int = 0,
         default_temp_table_name: str = "_temp",
         always_rewrite: bool = False,
+        catalog: Optional[CatalogMirror] = None,
     ) -> None:
         """
         row_limit is for super large data, you want to force every query as preview (deprecated now)
+        catalog: active tables are read from the (session) catalog mirror, otherwise tracked by `add_new_table()`
         """
 
         if latest_table is not None:
@@ -33,6 +164,14 @@ class QueryRewriterForDuckDB:
         self.row_limit = row_limit
         self.default_temp_table_name = default_temp_table_name
         self.always_rewrite = always_rewrite
+        self.catalog = catalog
+        # NOTE: per instance, tables of a session must not leak into other sessions
+        self.current_active_tables: Set[str] = set()
+
+    def is_active_table(self, name: str) -> bool:
+        if self.catalog is not None:
+            return name in self.catalog
+        return name in self.current_active_tables
 
     def add_new_table(self, table_name: str) -> bool:
         """
@@ -49,51 +188,15 @@ class QueryRewriterForDuckDB:
         if latest_table is not None:
             self.latest_table = latest_table
 
-        if create_table_alias := self.create_table_alias_re.search(query):
-            # https://duckdb.org/docs/sql/statements/create_table.html
-            latest_table_name = create_table_alias.group(1)
-            expression = create_table_alias.group(2)
-            # NOTE: use OR REPLACE can support same table name override
-            if self.use_view_over_table:
-                # https://duckdb.org/docs/sql/statements/create_view.html
-                query = f"CREATE OR REPLACE VIEW {latest_table_name} AS {expression}"
-            else:
-                query = f"CREATE OR REPLACE TABLE {latest_table_name} AS {expression}"
-
-        if self.auto_from_table and "FROM" not in query.upper():
-            if "SELECT" in query:
-                query = query.replace("SELECT", f"FROM {self.latest_table} SELECT")
-            elif "select" in query:
-                query = query.replace("select", f"FROM {self.latest_table} SELECT")
-
-        if "SELECT" not in query.upper():
-            if query.strip() in self.current_active_tables:
-                # query is table name
-                # If only table name (without SELECT and FROM), then by default just output the table
-                query = f"FROM {query.strip()} SELECT *;"
-            else:
-                # https://duckdb.org/docs/sql/functions/char.html
-                # https://duckdb.org/docs/sql/functions/patternmatching.html
-                # Special case, query is a quick test
-                query = f"SELECT {query};"
-
-        # TODO: if use aggregate function but without GROUP BY, automatically inference columns
-        # BinderException: Binder Error: column "symbol" must appear in the GROUP BY clause or must be part of an aggregate function.
-        # Either add it to the GROUP BY list, or use "ANY_VALUE(symbol)" if the exact value of "symbol" is not important.
-
-        # TODO: not sure if this part make sense. Ideally, user should be aware of what they are doing.
-        # (operation can cancel when it took too much time)
-        if self.row_limit > 0:
-            if query.endswith(";"):
-                query = query.replace(";", f" LIMIT {self.row_limit};")
-            else:
-                query += f" LIMIT {self.row_limit};"
-
-        if not query.endswith(";"):
-            # This is not necessary but will make description seems complete
-            query += ";"
-
-        return query
+        # NOTE: memoized by (query, latest table, settings), see rewrite_query()
+        return rewrite_query(
+            query,
+            getattr(self, "latest_table", None),
+            self.is_active_table(query.strip()),
+            use_view_over_table=self.use_view_over_table,
+            auto_from_table=self.auto_from_table,
+            row_limit=self.row_limit,
+        )
 
     def creating_table(self, query: str) -> Optional[str]:
         if is_creating_table := self.create_table_name_re.search(query):
@@ -109,7 +212,19 @@ class QueryRewriterForDuckDB:
     def __call__(self, query: str) -> str:
         if not query.endswith(";") or self.always_rewrite:
             query = self.rewrite(query)
+        if self.catalog is not None:
+            # Tables are tracked by the catalog mirror after the query is executed (see `after_execute()`)
+            return query
         new_table_name = self.creating_table(query)
         if new_table_name:
             self.add_new_table(new_table_name)
         return query
+
+    def after_execute(self, query: str) -> CatalogChange:
+        """
+        Sync the catalog mirror after the query is executed, the latest created table become the latest table
+        """
+        change = self.catalog.after_statement(query)
+        if change.created:
+            self.latest_table = change.created[-1]
+        return change